@@ -0,0 +1,45 @@
+import glob
+import os
+import time
+
+from script_pool import THREAD_POLICIES, ScriptPool
+
+# Base directory where your data is stored
+base_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy'
+
+# Scripts solved by the benchmark (they rewrite their solution.json with the same content)
+BENCHMARK_PATTERN = os.path.join(base_dir, '*', '*_c', 'optimus-code.py')
+# Cores given to the pool; every policy runs one worker per core
+CORES = os.cpu_count() or 1
+# Seconds a script may run before its worker is stopped
+SCRIPT_TIMEOUT = 600
+# Runs per policy; the best wall time is reported
+REPEATS = 1
+
+
+# Function to solve every script once under a thread policy; returns (wall seconds, failed solves)
+def run_policy(script_paths, policy):
+    with ScriptPool(CORES, SCRIPT_TIMEOUT, cores=CORES) as pool:
+        # Warm-up: the gurobipy import of the workers is not part of the measurement
+        list(pool.map(script_paths[:CORES], policy=policy))
+        start = time.perf_counter()
+        failed = sum(1 for result in pool.map(script_paths, policy=policy) if not result.ok)
+        return time.perf_counter() - start, failed
+
+
+def main():
+    script_paths = sorted(glob.glob(BENCHMARK_PATTERN))
+    if not script_paths:
+        print(f"No scripts match {BENCHMARK_PATTERN}")
+        return
+    print(f"Benchmarking {len(script_paths)} solves on {CORES} cores")
+
+    print(f"{'policy':>8} | {'wall (s)':>9} | {'solves/min':>10} | {'failed':>6}")
+    for policy in THREAD_POLICIES:
+        runs = [run_policy(script_paths, policy) for _ in range(REPEATS)]
+        wall, failed = min(runs)
+        print(f"{policy:>8} | {wall:>9.2f} | {len(script_paths) * 60 / wall:>10.1f} | {failed:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import re
+
+# Identifiers in gurobipy code, e.g. "x", "slack_0", "NumTrucks" in "model.addConstr(x[i] <= NumTrucks)"
+CODE_TOKEN_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# Identifiers in LaTeX formulations. LaTeX commands (\sum, \leq, \text, ...) are matched together
+# with their backslash so that they can be dropped.
+FORMULATION_TOKEN_PATTERN = re.compile(r'\\?[A-Za-z][A-Za-z0-9_]*')
+
+
+def resolve_token(token, variable_names):
+    """
+    Returns the variable a token refers to, or None.
+    An exact match wins (so a digit variable "x_0" stays "x_0"); otherwise trailing subscripts are
+    stripped one at a time, so "x_i", "x_{i}" (tokenised as "x_") and "x_i_j" all resolve to "x".
+    """
+    candidate = token
+    while candidate:
+        if candidate in variable_names:
+            return candidate
+        if '_' not in candidate:
+            return None
+        candidate = candidate.rsplit('_', 1)[0]
+    return None
+
+
+def variables_in_formulation(formulation, variable_names):
+    found = set()
+    for token in FORMULATION_TOKEN_PATTERN.findall(formulation or ''):
+        if token.startswith('\\'):
+            continue
+        name = resolve_token(token, variable_names)
+        if name is not None:
+            found.add(name)
+    return found
+
+
+def variables_in_code(code, variable_names):
+    return {token for token in CODE_TOKEN_PATTERN.findall(code or '') if token in variable_names}
+
+
+def variables_in_item(item, variable_names):
+    """
+    Variables referenced by a constraint or objective entry of problem_info.json, using both its
+    LaTeX formulation and its gurobipy code.
+    """
+    found = variables_in_formulation(item.get('formulation', ''), variable_names)
+    code = item.get('code', {})
+    if isinstance(code, dict):
+        found |= variables_in_code(code.get('gurobipy', ''), variable_names)
+    return found
+
+
+class IncidenceIndex:
+    """
+    Token-level variable/constraint incidence of one problem_info.json.
+    Constraint ids are positions in the problem's constraint list.
+    """
+
+    def __init__(self, variables, constraints, objective):
+        self.constraints = constraints
+        self.objective = objective
+        variable_names = set(variables)
+
+        # constraint id -> set of variables, variable -> list of constraint ids
+        self.constraint_variables = []
+        self.variable_constraints = {name: [] for name in variables}
+        for constraint_id, constraint in enumerate(constraints):
+            involved = variables_in_item(constraint, variable_names)
+            self.constraint_variables.append(involved)
+            for name in involved:
+                self.variable_constraints[name].append(constraint_id)
+
+        self.objective_variables = variables_in_item(objective, variable_names)
+
+    def constraint_ids(self, variable_name):
+        return self.variable_constraints.get(variable_name, [])
+
+    def constraints_involving(self, variable_name):
+        """
+        Constraints involving the variable, in the {'description', 'formulation'} form used in prompts.
+        """
+        return [
+            {
+                'description': self.constraints[constraint_id].get('description', ''),
+                'formulation': self.constraints[constraint_id].get('formulation', '')
+            }
+            for constraint_id in self.constraint_ids(variable_name)
+        ]
+
+    def in_objective(self, variable_name):
+        return variable_name in self.objective_variables
+
+    def variables_in(self, constraint_id):
+        return self.constraint_variables[constraint_id]
+
+    def degree(self, variable_name):
+        """
+        Number of constraints the variable appears in.
+        """
+        return len(self.constraint_ids(variable_name))
+
+
+def build_incidence_index(variables, constraints, objective):
+    return IncidenceIndex(variables, constraints, objective)
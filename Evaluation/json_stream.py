@@ -0,0 +1,55 @@
+class JsonObjectScanner:
+    """
+    Incremental scanner for the first top-level JSON object in a stream of text chunks. Text before
+    the opening brace is skipped and braces inside strings are ignored, so the object is recognised
+    as soon as its closing brace arrives, whatever prose follows it.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.result = None
+
+    def feed(self, chunk):
+        """
+        Consumes a chunk and returns the complete object text once it has been closed, else None.
+        """
+        if self.result is not None:
+            return self.result
+        start = 0
+        for position, char in enumerate(chunk):
+            if self.depth == 0:
+                # Still looking for the opening brace
+                if char == '{':
+                    start = position
+                    self.depth = 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                self.depth += 1
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.parts.append(chunk[start:position + 1])
+                    self.result = ''.join(self.parts)
+                    return self.result
+        if self.depth > 0:
+            self.parts.append(chunk[start:])
+        return None
+
+    @property
+    def text(self):
+        """
+        The object text received so far (the complete object once closed).
+        """
+        return self.result if self.result is not None else ''.join(self.parts)
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import time
+
+from openai.types.chat import ChatCompletion
+
+from llm_cache import cache_key
+from llm_client import get_cache, record_usage
+from llm_telemetry import record_call
+
+# Job files (request JSONL, results, state) are kept here
+BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_batches')
+
+# Seconds between two status checks of a submitted job
+POLL_INTERVAL = 60
+# Completion window requested from the Batch API
+COMPLETION_WINDOW = '24h'
+ENDPOINT = '/v1/chat/completions'
+
+TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+class BatchRequests:
+    """
+    Chat completion requests collected for one batch job. The custom id of a request is its response
+    cache key, so the results can be written straight into the response cache, where the regular
+    (interactive) code path finds them. Requests that are already cached are skipped.
+    """
+
+    def __init__(self):
+        self.lines = {}
+        self.models = {}
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, model, messages, temperature=None, **extra):
+        key = cache_key(model, messages, temperature, **extra)
+        cache = get_cache()
+        if key in self.lines or (cache is not None and cache.contains(key)):
+            self.skipped += 1
+            return key
+        body = {'model': model, 'messages': messages}
+        if temperature is not None:
+            body['temperature'] = temperature
+        body.update(extra)
+        self.lines[key] = {'custom_id': key, 'method': 'POST', 'url': ENDPOINT, 'body': body}
+        self.models[key] = model
+        return key
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for line in self.lines.values():
+                f.write(json.dumps(line) + '\n')
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+def _read_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_state(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def submit(client, input_path, name):
+    with open(input_path, 'rb') as f:
+        uploaded = client.files.create(file=f, purpose='batch')
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=ENDPOINT,
+        completion_window=COMPLETION_WINDOW,
+        metadata={'job': name}
+    )
+    print(f"Submitted batch {batch.id} ({name}) with input file {uploaded.id}")
+    return batch
+
+
+def wait(client, batch_id, poll_interval=POLL_INTERVAL):
+    """
+    Polls a batch until it reaches a terminal status and returns it.
+    """
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f", {counts.completed}/{counts.total} done, {counts.failed} failed" if counts else ''
+        print(f"Batch {batch_id}: {batch.status}{progress}")
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def ingest(client, batch, models, cache):
+    """
+    Downloads the output file of a finished batch and writes every successful completion to the
+    response cache. Returns (ingested, failed).
+    """
+    ingested = failed = 0
+    if batch.output_file_id:
+        content = client.files.content(batch.output_file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            key = result.get('custom_id')
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                failed += 1
+                continue
+            completion = ChatCompletion.model_validate(response['body'])
+            model = models.get(key, completion.model)
+            cache.put(key, model, completion.model_dump_json())
+            record_usage(completion)
+            usage = completion.usage
+            record_call(
+                model, 0.0, 'batch',
+                prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+                completion_tokens=getattr(usage, 'completion_tokens', 0) or 0
+            )
+            ingested += 1
+    if batch.error_file_id:
+        content = client.files.content(batch.error_file_id).text
+        failed += sum(1 for line in content.splitlines() if line.strip())
+    return ingested, failed
+
+
+def run_batch(client, requests, name, poll_interval=POLL_INTERVAL):
+    """
+    Writes the requests to a JSONL job file, submits it to the Batch API (or resumes the job already
+    submitted for the same requests), waits for it and ingests the results into the response cache.
+    Requests that fail in the batch are simply left uncached, so the regular code path sends them.
+    """
+    cache = get_cache()
+    if cache is None:
+        print("The batch mode delivers its results through the response cache; set CACHE_ENABLED = True in llm_client.py")
+        return 0
+    if not len(requests):
+        print(f"Batch {name}: nothing to submit ({requests.skipped} requests already cached or duplicated)")
+        return 0
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    input_path = os.path.join(BATCH_DIR, f'{name}_requests.jsonl')
+    state_path = os.path.join(BATCH_DIR, f'{name}_state.json')
+    input_hash = requests.write(input_path)
+    print(f"Batch {name}: {len(requests)} requests written to {input_path} ({requests.skipped} already cached or duplicated)")
+
+    state = _read_state(state_path)
+    if state and state.get('input_hash') == input_hash and state.get('status') not in ('failed', 'expired', 'cancelled'):
+        print(f"Resuming batch {state['batch_id']}")
+        batch_id = state['batch_id']
+    else:
+        batch_id = submit(client, input_path, name).id
+        _write_state(state_path, {'batch_id': batch_id, 'input_hash': input_hash, 'status': 'submitted',
+                                  'submitted_at': time.time()})
+
+    batch = wait(client, batch_id, poll_interval)
+    _write_state(state_path, {'batch_id': batch_id, 'input_hash': input_hash, 'status': batch.status,
+                              'finished_at': time.time()})
+    if batch.status != 'completed':
+        print(f"Batch {batch_id} ended with status {batch.status}; the requests will be sent interactively")
+        return 0
+
+    ingested, failed = ingest(client, batch, requests.models, cache)
+    print(f"Batch {batch_id}: {ingested} responses ingested into the response cache, {failed} failed")
+    os.remove(state_path)
+    return ingested
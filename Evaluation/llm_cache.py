@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Single SQLite file shared by every LLM call site (mapping, judging, rephrasing)
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cache.sqlite')
+
+# Eviction limits: entries older than MAX_AGE_SECONDS are dropped, then the least recently
+# used entries are dropped until the cache fits in MAX_ENTRIES and MAX_BYTES
+MAX_ENTRIES = 200000
+MAX_BYTES = 1024 * 1024 * 1024
+MAX_AGE_SECONDS = 90 * 24 * 3600
+
+# Run the (relatively expensive) size-based eviction once every EVICT_EVERY writes
+EVICT_EVERY = 200
+
+
+def cache_key(model, messages, temperature, **extra):
+    """
+    Content address of a chat completion request: a SHA-256 over the model, the messages,
+    the temperature and any other request options that change the answer (e.g. n, response_format).
+    """
+    payload = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+    }
+    if extra:
+        payload['extra'] = extra
+    serialized = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent, content-addressed cache of chat completion responses stored in one SQLite file.
+    Responses are stored as the JSON dump of the completion object.
+    Safe to share between threads and between the tasks of one event loop.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES,
+                 max_age_seconds=MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        # Counters for this process; the lifetime totals are kept in the stats table
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' model TEXT,'
+                ' response TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created REAL NOT NULL,'
+                ' accessed REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        self.evict()
+
+    def _bump(self, name):
+        self._conn.execute(
+            'INSERT INTO stats (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1',
+            (name,)
+        )
+
+    def get(self, key):
+        """
+        Returns the cached response JSON for the key, or None on a miss (or an expired entry).
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT response, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.max_age_seconds:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                self._bump('misses')
+                return None
+            self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            self._bump('hits')
+            return row[0]
+
+    def take(self, key):
+        """
+        Like get, but removes the entry: a sampled answer (e.g. written by a batch job) is used once.
+        """
+        response = self.get(key)
+        if response is not None:
+            with self._lock, self._conn:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+        return response
+
+    def contains(self, key):
+        """
+        Whether a live entry exists for the key, without counting a hit or a miss.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT created FROM responses WHERE key = ?', (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.max_age_seconds
+
+    def put(self, key, model, response_json):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, response_json, len(response_json.encode('utf-8')), now, now)
+            )
+            self._writes += 1
+            run_eviction = self._writes % EVICT_EVERY == 0
+        if run_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used entries until both limits hold.
+        Returns the number of entries removed.
+        """
+        removed = 0
+        with self._lock, self._conn:
+            cutoff = time.time() - self.max_age_seconds
+            removed += self._conn.execute('DELETE FROM responses WHERE created < ?', (cutoff,)).rowcount
+
+            count, total_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                return removed
+
+            # Walk from the least recently used entry until we are back under both limits
+            to_delete = []
+            for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed ASC'):
+                if count <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                to_delete.append((key,))
+                count -= 1
+                total_bytes -= size
+            self._conn.executemany('DELETE FROM responses WHERE key = ?', to_delete)
+            removed += len(to_delete)
+        return removed
+
+    def stats(self):
+        """
+        Returns the hit/miss counters for this process and for the lifetime of the cache file,
+        together with the current size of the cache.
+        """
+        with self._lock:
+            totals = dict(self._conn.execute('SELECT name, value FROM stats').fetchall())
+            count, total_bytes = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'total_hits': totals.get('hits', 0),
+            'total_misses': totals.get('misses', 0),
+            'entries': count,
+            'bytes': total_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
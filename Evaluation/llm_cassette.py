@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+
+# Default cassette file; one JSON line per recorded request/response pair
+CASSETTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_cassette.jsonl')
+
+
+class CassetteMiss(KeyError):
+    """
+    Raised in replay mode for a request that was never recorded.
+    """
+
+
+class Cassette:
+    """
+    Recorded chat completion exchanges keyed by the request's cache key (see llm_cache.cache_key).
+    A key recorded several times is replayed round-robin, so sampled requests keep their variety.
+    """
+
+    def __init__(self, path=CASSETTE_PATH):
+        self.path = path
+        self.entries = {}
+        self._next = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry['key'], []).append(entry)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    def record(self, key, request, response_json, latency):
+        entry = {
+            'key': key,
+            'request': request,
+            'response': json.loads(response_json),
+            'latency': latency
+        }
+        with self._lock:
+            self.entries.setdefault(key, []).append(entry)
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+    def lookup(self, key):
+        """
+        Returns the next recorded entry for the key ({'request', 'response', 'latency'}).
+        """
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise CassetteMiss(key)
+            position = self._next.get(key, 0)
+            self._next[key] = position + 1
+            return entries[position % len(entries)]
+
+
+def replay_delay(entry, latency):
+    """
+    Simulated latency for a replayed entry: None for no delay, 'recorded' for the latency measured
+    when the entry was recorded, or a fixed number of seconds.
+    """
+    if latency is None:
+        return 0.0
+    if latency == 'recorded':
+        return entry.get('latency') or 0.0
+    return float(latency)
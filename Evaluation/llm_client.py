@@ -0,0 +1,502 @@
+import asyncio
+import json
+import os
+import time
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from openai.types.chat import ChatCompletion
+
+from llm_cache import ResponseCache, cache_key
+from json_stream import JsonObjectScanner
+from llm_cassette import Cassette, replay_delay
+from llm_telemetry import record_call
+from prompt_budget import count_message_tokens, count_tokens
+from rate_limiter import RateLimiter, backoff_delay, retry_after_seconds
+
+# Serve repeated requests from the on-disk response cache instead of the network
+CACHE_ENABLED = True
+
+# 'live' calls the API; 'record' also appends every exchange to the cassette file; 'replay' answers
+# from the cassette only (no network, no API key) and fails on unrecorded requests.
+# Set with the EQUIVAMAP_LLM_MODE environment variable, e.g. EQUIVAMAP_LLM_MODE=replay.
+LLM_MODE = os.environ.get('EQUIVAMAP_LLM_MODE', 'live')
+# Cassette file used by the record and replay modes (default: Evaluation/llm_cassette.jsonl)
+CASSETTE_PATH = os.environ.get('EQUIVAMAP_CASSETTE')
+# Simulated latency when replaying: None, 'recorded' (the latency measured when recording) or seconds
+REPLAY_LATENCY = None
+
+# Requests-per-minute and tokens-per-minute budgets per model. They are only the starting point:
+# the limiter follows the x-ratelimit-* headers returned by the API.
+RATE_LIMITS = {
+    'gpt-4': (500, 10000),
+    'gpt-4o': (500, 30000),
+    'gpt-4o-mini': (500, 200000),
+}
+DEFAULT_RATE_LIMIT = (500, 30000)
+# Upper bound for the adaptive number of requests in flight per model
+MAX_CONCURRENCY = 16
+# Retries on 429s, timeouts, connection errors and 5xx before the error is raised to the caller
+MAX_RETRIES = 6
+# Completion tokens assumed per request when max_tokens is not set, for the tokens-per-minute budget
+DEFAULT_COMPLETION_TOKENS = 500
+
+# Errors worth retrying; anything else (bad request, authentication, ...) is raised immediately
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+_cache = None
+_cassette = None
+_rate_limiters = {}
+
+# Token usage of the requests answered by the API (not the cache) in this process. cached_tokens
+# counts the prompt tokens served from the provider-side prefix cache.
+usage_totals = {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0}
+# Streamed requests, how many of them were cut off once their JSON object was complete, and how many
+# have estimated token counts (the usage chunk only comes at the end of a stream read to completion)
+stream_totals = {'streams': 0, 'cut_early': 0, 'estimated_usage': 0}
+
+
+def get_cache():
+    """
+    Returns the process-wide response cache, opening it on first use (None when disabled).
+    """
+    global _cache
+    if CACHE_ENABLED and _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+def get_cassette():
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette(CASSETTE_PATH) if CASSETTE_PATH else Cassette()
+    return _cassette
+
+
+def cached_prompt_tokens(response):
+    """
+    Number of prompt tokens the provider served from its prefix cache (0 when not reported).
+    """
+    usage = getattr(response, 'usage', None)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None) or 0
+
+
+def record_usage(response):
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    usage_totals['requests'] += 1
+    usage_totals['prompt_tokens'] += usage.prompt_tokens or 0
+    usage_totals['completion_tokens'] += usage.completion_tokens or 0
+    usage_totals['cached_tokens'] += cached_prompt_tokens(response)
+
+
+def get_rate_limiter(model):
+    if model not in _rate_limiters:
+        requests_per_minute, tokens_per_minute = RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+        _rate_limiters[model] = RateLimiter(requests_per_minute, tokens_per_minute, MAX_CONCURRENCY)
+    return _rate_limiters[model]
+
+
+def estimate_request_tokens(messages, extra):
+    """
+    Rough token count of a request (about 4 characters per token) plus its expected completion.
+    """
+    characters = len(json.dumps(messages, ensure_ascii=False))
+    completion = extra.get('max_tokens') or DEFAULT_COMPLETION_TOKENS
+    return characters // 4 + completion * extra.get('n', 1)
+
+
+def _retry_delay(error, limiter, model, start, attempt):
+    """
+    Returns how long to wait before retrying after a retryable error, or re-raises it once the
+    retries are exhausted (or the account is out of quota, which no retry will fix).
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    retry_after = retry_after_seconds(headers)
+    if isinstance(error, RateLimitError):
+        if getattr(error, 'code', None) == 'insufficient_quota':
+            attempt = MAX_RETRIES
+        else:
+            limiter.on_rate_limited(retry_after)
+    if attempt >= MAX_RETRIES:
+        record_call(model, time.perf_counter() - start, 'error', retries=attempt, error=error)
+        raise error
+    delay = backoff_delay(attempt, retry_after)
+    print(f"{type(error).__name__} from {model}, retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RETRIES})")
+    return delay
+
+
+def _used_tokens(response):
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None)
+
+
+def _request_kwargs(model, messages, temperature, extra):
+    kwargs = {'model': model, 'messages': messages}
+    if temperature is not None:
+        kwargs['temperature'] = temperature
+    kwargs.update(extra)
+    return kwargs
+
+
+def is_sampled(temperature, cache_samples=False):
+    """
+    Whether a request samples (temperature above 0, or None: the API default of 1) and its answers
+    should not be replayed from the cache. Callers that want sampled answers cached opt in with
+    cache_samples=True.
+    """
+    return (temperature is None or temperature > 0) and not cache_samples
+
+
+def _lookup(model, key, start, sampled=False):
+    """
+    Returns the cached completion for the key (recording a cache-hit event), or None.
+    The cache is bypassed when recording, so that the cassette gets real responses. Sampled requests
+    are never stored; the entry a batch job wrote for one is used once and removed, so reruns draw
+    fresh samples.
+    """
+    if LLM_MODE == 'record':
+        return None
+    cache = get_cache()
+    if cache is None:
+        return None
+    cached = cache.take(key) if sampled else cache.get(key)
+    if cached is None:
+        return None
+    record_call(model, time.perf_counter() - start, 'cache_hit')
+    return ChatCompletion.model_validate_json(cached)
+
+
+def _replay(model, key, start):
+    """
+    Returns (completion, simulated delay) for a request recorded in the cassette.
+    """
+    try:
+        entry = get_cassette().lookup(key)
+    except KeyError:
+        record_call(model, time.perf_counter() - start, 'error', error=f"request not in cassette: {key}")
+        raise
+    response = ChatCompletion.model_validate(entry['response'])
+    return response, replay_delay(entry, REPLAY_LATENCY)
+
+
+def _replayed(model, response, start):
+    record_usage(response)
+    usage = getattr(response, 'usage', None)
+    record_call(
+        model,
+        time.perf_counter() - start,
+        'replay',
+        prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+        completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+        cached_tokens=cached_prompt_tokens(response)
+    )
+    return response
+
+
+def _store(model, key, response, start, retries=0, request=None, estimated=False, sampled=False):
+    """
+    Records usage and telemetry for a completion answered by the API and writes it to the cache
+    (unless it is sampled) and to the cassette in record mode. estimated marks token counts that were
+    not reported by the API.
+    """
+    latency = time.perf_counter() - start
+    record_usage(response)
+    usage = getattr(response, 'usage', None)
+    record_call(
+        model,
+        latency,
+        'ok',
+        prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+        completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+        cached_tokens=cached_prompt_tokens(response),
+        retries=retries,
+        estimated=estimated
+    )
+    cache = get_cache()
+    if cache is not None and not sampled:
+        cache.put(key, model, response.model_dump_json())
+    if LLM_MODE == 'record':
+        get_cassette().record(key, request, response.model_dump_json(), latency)
+    return response
+
+
+def chat_completion(client, model, messages, temperature=None, cache_samples=False, **extra):
+    """
+    Drop-in replacement for client.chat.completions.create that goes through the response cache,
+    waits for the model's rate limiter, retries transient errors with exponential backoff and
+    records a telemetry event. A temperature of None leaves the API default in place. Sampled requests
+    (see is_sampled) skip the cache unless cache_samples is set.
+    """
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature, **extra)
+    sampled = is_sampled(temperature, cache_samples)
+    if LLM_MODE == 'replay':
+        response, delay = _replay(model, key, start)
+        time.sleep(delay)
+        return _replayed(model, response, start)
+    cached = _lookup(model, key, start, sampled)
+    if cached is not None:
+        return cached
+
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(messages, extra)
+    kwargs = _request_kwargs(model, messages, temperature, extra)
+    # Retries are handled here, with the limiter in the loop, instead of inside the SDK
+    raw_client = client.with_options(max_retries=0)
+    attempt = 0
+    while True:
+        limiter.acquire(estimated)
+        used = None
+        try:
+            raw = raw_client.chat.completions.with_raw_response.create(**kwargs)
+            limiter.update_from_headers(raw.headers)
+            response = raw.parse()
+            used = _used_tokens(response)
+            return _store(model, key, response, start, retries=attempt, request=kwargs, sampled=sampled)
+        except RETRYABLE_ERRORS as e:
+            delay = _retry_delay(e, limiter, model, start, attempt)
+        except Exception as e:
+            record_call(model, time.perf_counter() - start, 'error', retries=attempt, error=e)
+            raise
+        finally:
+            limiter.release(estimated, used)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def async_chat_completion(async_client, model, messages, temperature=None, cache_samples=False, **extra):
+    """
+    Async counterpart of chat_completion for an AsyncOpenAI client.
+    """
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature, **extra)
+    sampled = is_sampled(temperature, cache_samples)
+    if LLM_MODE == 'replay':
+        response, delay = _replay(model, key, start)
+        await asyncio.sleep(delay)
+        return _replayed(model, response, start)
+    cached = _lookup(model, key, start, sampled)
+    if cached is not None:
+        return cached
+
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(messages, extra)
+    kwargs = _request_kwargs(model, messages, temperature, extra)
+    raw_client = async_client.with_options(max_retries=0)
+    attempt = 0
+    while True:
+        await limiter.acquire_async(estimated)
+        used = None
+        try:
+            raw = await raw_client.chat.completions.with_raw_response.create(**kwargs)
+            limiter.update_from_headers(raw.headers)
+            response = raw.parse()
+            used = _used_tokens(response)
+            return _store(model, key, response, start, retries=attempt, request=kwargs, sampled=sampled)
+        except RETRYABLE_ERRORS as e:
+            delay = _retry_delay(e, limiter, model, start, attempt)
+        except Exception as e:
+            record_call(model, time.perf_counter() - start, 'error', retries=attempt, error=e)
+            raise
+        finally:
+            limiter.release(estimated, used)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def _streamed_completion(model, content, messages, finish_reason, usage=None):
+    """
+    Builds a ChatCompletion from a streamed answer, with the usage reported in the last chunk of the
+    stream. A stream cut off before that chunk has no usage; its token counts are then counted locally.
+    """
+    if usage is None:
+        prompt_tokens = count_message_tokens(messages, model)
+        completion_tokens = max(count_tokens(content, model), 1)
+        usage = {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+    return ChatCompletion.model_validate({
+        'id': f'chatcmpl-stream-{int(time.time() * 1000)}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': finish_reason
+        }],
+        'usage': usage
+    })
+
+
+def _chunk_text(chunk):
+    if not chunk.choices:
+        return ''
+    return chunk.choices[0].delta.content or ''
+
+
+def _chunk_usage(chunk):
+    # Only the last chunk of a stream requested with include_usage carries the usage
+    usage = getattr(chunk, 'usage', None)
+    return usage.model_dump(exclude_none=True) if usage is not None else None
+
+
+def _stream_result(model, messages, scanner, received, usage):
+    """
+    Returns (completion, whether its usage is estimated) for a finished or cut-off stream: the JSON
+    object alone when one was closed, otherwise everything received (left to the caller's parser).
+    """
+    stream_totals['streams'] += 1
+    if usage is None:
+        stream_totals['estimated_usage'] += 1
+    if scanner.result is not None:
+        stream_totals['cut_early'] += 1
+        return _streamed_completion(model, scanner.result, messages, 'stop', usage), usage is None
+    return _streamed_completion(model, ''.join(received), messages, 'stop', usage), usage is None
+
+
+def stream_json_completion(client, model, messages, temperature=None, cache_samples=False, **extra):
+    """
+    Like chat_completion, for prompts that ask for a single JSON object: the answer is streamed and
+    the stream is closed as soon as the first top-level object is complete, so trailing prose is
+    neither waited for nor generated. The returned completion holds only that object.
+    """
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature, **extra)
+    sampled = is_sampled(temperature, cache_samples)
+    if LLM_MODE == 'replay':
+        response, delay = _replay(model, key, start)
+        time.sleep(delay)
+        return _replayed(model, response, start)
+    cached = _lookup(model, key, start, sampled)
+    if cached is not None:
+        return cached
+
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(messages, extra)
+    kwargs = _request_kwargs(model, messages, temperature, extra)
+    raw_client = client.with_options(max_retries=0)
+    attempt = 0
+    while True:
+        limiter.acquire(estimated)
+        used = None
+        try:
+            raw = raw_client.chat.completions.with_raw_response.create(
+                stream=True, stream_options={'include_usage': True}, **kwargs
+            )
+            limiter.update_from_headers(raw.headers)
+            stream = raw.parse()
+            scanner = JsonObjectScanner()
+            received = []
+            usage = None
+            try:
+                for chunk in stream:
+                    usage = _chunk_usage(chunk) or usage
+                    text = _chunk_text(chunk)
+                    received.append(text)
+                    if scanner.feed(text) is not None:
+                        break
+            finally:
+                # Closing the connection stops the generation on the server side
+                stream.close()
+            response, usage_estimated = _stream_result(model, messages, scanner, received, usage)
+            used = _used_tokens(response)
+            return _store(model, key, response, start, retries=attempt, request=kwargs,
+                          estimated=usage_estimated, sampled=sampled)
+        except RETRYABLE_ERRORS as e:
+            delay = _retry_delay(e, limiter, model, start, attempt)
+        except Exception as e:
+            record_call(model, time.perf_counter() - start, 'error', retries=attempt, error=e)
+            raise
+        finally:
+            limiter.release(estimated, used)
+        time.sleep(delay)
+        attempt += 1
+
+
+async def async_stream_json_completion(async_client, model, messages, temperature=None, cache_samples=False, **extra):
+    """
+    Async counterpart of stream_json_completion for an AsyncOpenAI client.
+    """
+    start = time.perf_counter()
+    key = cache_key(model, messages, temperature, **extra)
+    sampled = is_sampled(temperature, cache_samples)
+    if LLM_MODE == 'replay':
+        response, delay = _replay(model, key, start)
+        await asyncio.sleep(delay)
+        return _replayed(model, response, start)
+    cached = _lookup(model, key, start, sampled)
+    if cached is not None:
+        return cached
+
+    limiter = get_rate_limiter(model)
+    estimated = estimate_request_tokens(messages, extra)
+    kwargs = _request_kwargs(model, messages, temperature, extra)
+    raw_client = async_client.with_options(max_retries=0)
+    attempt = 0
+    while True:
+        await limiter.acquire_async(estimated)
+        used = None
+        try:
+            raw = await raw_client.chat.completions.with_raw_response.create(
+                stream=True, stream_options={'include_usage': True}, **kwargs
+            )
+            limiter.update_from_headers(raw.headers)
+            stream = raw.parse()
+            scanner = JsonObjectScanner()
+            received = []
+            usage = None
+            try:
+                async for chunk in stream:
+                    usage = _chunk_usage(chunk) or usage
+                    text = _chunk_text(chunk)
+                    received.append(text)
+                    if scanner.feed(text) is not None:
+                        break
+            finally:
+                await stream.close()
+            response, usage_estimated = _stream_result(model, messages, scanner, received, usage)
+            used = _used_tokens(response)
+            return _store(model, key, response, start, retries=attempt, request=kwargs,
+                          estimated=usage_estimated, sampled=sampled)
+        except RETRYABLE_ERRORS as e:
+            delay = _retry_delay(e, limiter, model, start, attempt)
+        except Exception as e:
+            record_call(model, time.perf_counter() - start, 'error', retries=attempt, error=e)
+            raise
+        finally:
+            limiter.release(estimated, used)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def print_cache_stats():
+    cache = get_cache()
+    if cache is None:
+        return
+    stats = cache.stats()
+    print(
+        f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses this run "
+        f"({stats['total_hits']} hits, {stats['total_misses']} misses overall); "
+        f"{stats['entries']} entries, {stats['bytes'] / 1e6:.1f} MB"
+    )
+
+
+def print_usage_stats():
+    prompt_tokens = usage_totals['prompt_tokens']
+    cached_share = usage_totals['cached_tokens'] / prompt_tokens if prompt_tokens else 0.0
+    print(
+        f"LLM token usage: {usage_totals['requests']} requests, {prompt_tokens} prompt tokens "
+        f"({usage_totals['cached_tokens']} cached, {cached_share:.0%}), "
+        f"{usage_totals['completion_tokens']} completion tokens"
+    )
+    if stream_totals['streams']:
+        print(
+            f"Streamed requests: {stream_totals['streams']}, {stream_totals['cut_early']} closed as soon as "
+            f"their JSON object was complete, {stream_totals['estimated_usage']} with locally counted "
+            f"(estimated) tokens"
+        )
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from llm_telemetry import estimate_cost
+from rate_limiter import TokenBucket
+
+# Number of the largest jobs listed in the projection
+TOP_JOBS = 5
+
+
+class Job:
+    """
+    One unit of LLM work (a problem pair) with the estimated size of its requests.
+    """
+
+    def __init__(self, key, model, requests, prompt_tokens, completion_tokens, payload=None):
+        self.key = key
+        self.model = model
+        self.requests = requests
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.payload = payload
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def cost(self):
+        return estimate_cost(self.model, self.prompt_tokens, 0, self.completion_tokens)
+
+
+def largest_first(jobs):
+    return sorted(jobs, key=lambda job: job.tokens, reverse=True)
+
+
+def print_projection(jobs, tokens_per_minute):
+    """
+    Prints the projected token count, cost and duration of the jobs before they are dispatched.
+    Escalations and repairs are not known in advance, so both figures are lower bounds.
+    """
+    if not jobs:
+        return
+    requests = sum(job.requests for job in jobs)
+    prompt_tokens = sum(job.prompt_tokens for job in jobs)
+    completion_tokens = sum(job.completion_tokens for job in jobs)
+    cost = sum(job.cost for job in jobs)
+    minutes = (prompt_tokens + completion_tokens) / tokens_per_minute
+    print("\n=== Projected LLM work ===")
+    print(f"{len(jobs)} jobs, {requests} requests, {prompt_tokens} prompt + {completion_tokens} completion tokens")
+    print(f"Projected cost: ${cost:.2f} (first tier only, before cache hits)")
+    print(f"Projected duration: {minutes:.1f} min at {tokens_per_minute} tokens/min")
+    print("Largest jobs:")
+    for job in largest_first(jobs)[:TOP_JOBS]:
+        print(f"  {job.key}: {job.tokens} tokens in {job.requests} requests, ${job.cost:.3f}")
+    print()
+
+
+class LargestFirstScheduler:
+    """
+    Dispatches jobs largest first under a global tokens-per-minute budget: a job is started once the
+    budget has room for its estimated tokens. Starting the big jobs first keeps a few huge prompts
+    from being the only work left at the end of a sweep.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self.budget = TokenBucket(tokens_per_minute)
+
+    def run(self, jobs, worker):
+        for job in largest_first(jobs):
+            wait = self.budget.reserve(job.tokens)
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.budget.reserve(job.tokens)
+            worker(job)
+
+    async def run_async(self, jobs, worker):
+        """
+        Starts worker(job) as a task for every job, largest first, and waits for all of them.
+        """
+        tasks = []
+        for job in largest_first(jobs):
+            wait = self.budget.reserve(job.tokens)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.budget.reserve(job.tokens)
+            tasks.append(asyncio.create_task(worker(job)))
+        await asyncio.gather(*tasks)
@@ -0,0 +1,177 @@
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# JSONL event log shared by every LLM call site; one line per call
+TELEMETRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'llm_events.jsonl')
+TELEMETRY_ENABLED = True
+
+# USD per 1M tokens: (prompt, cached prompt, completion). Unknown models are reported with cost 0.
+PRICING = {
+    'gpt-4': (30.00, 30.00, 60.00),
+    'gpt-4-turbo': (10.00, 10.00, 30.00),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+}
+
+# Batch API requests are billed at this fraction of the regular price
+BATCH_DISCOUNT = 0.5
+
+# Tags (problem, suffix, ...) attached to every event recorded in the current context.
+# Context variables follow asyncio tasks, so concurrent pairs keep their own tags.
+_tags = contextvars.ContextVar('llm_tags', default={})
+_write_lock = threading.Lock()
+
+
+@contextmanager
+def llm_tags(**tags):
+    """
+    Attaches the given tags (e.g. problem='12', suffix='_d') to the events recorded inside the block.
+    """
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def model_pricing(model):
+    if model in PRICING:
+        return PRICING[model]
+    # Dated snapshots such as gpt-4o-2024-08-06 are priced like their base model
+    for name in sorted(PRICING, key=len, reverse=True):
+        if model and model.startswith(name + '-'):
+            return PRICING[name]
+    return (0.0, 0.0, 0.0)
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    prompt_price, cached_price, completion_price = model_pricing(model)
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return (uncached * prompt_price + cached_tokens * cached_price + completion_tokens * completion_price) / 1e6
+
+
+def call_cost(model, outcome, prompt_tokens, cached_tokens, completion_tokens):
+    if outcome == 'replay':
+        return 0.0
+    cost = estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens)
+    return cost * BATCH_DISCOUNT if outcome == 'batch' else cost
+
+
+def record_call(model, latency, outcome, prompt_tokens=0, completion_tokens=0, cached_tokens=0,
+                retries=0, error=None, **fields):
+    """
+    Appends one event to the telemetry log.
+    outcome is 'ok', 'cache_hit', 'replay' (answered from a cassette), 'batch' (a Batch API result)
+    or 'error'; cache hits cost nothing and carry no token counts, replays carry the recorded token
+    counts but cost nothing, batch results are billed at BATCH_DISCOUNT.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    event = {
+        'time': time.time(),
+        'script': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+        'model': model,
+        'latency': latency,
+        'outcome': outcome,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'cached_tokens': cached_tokens,
+        'retries': retries,
+        'cost': call_cost(model, outcome, prompt_tokens, cached_tokens, completion_tokens),
+    }
+    event.update(_tags.get())
+    event.update(fields)
+    if error is not None:
+        event['error'] = str(error)[:500]
+    line = json.dumps(event)
+    with _write_lock:
+        with open(TELEMETRY_PATH, 'a') as f:
+            f.write(line + '\n')
+
+
+def load_events(path=TELEMETRY_PATH):
+    events = []
+    if not os.path.isfile(path):
+        return events
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+
+def percentile(values, q):
+    """
+    Nearest-rank percentile of a list of numbers (q in [0, 100]).
+    """
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(math.ceil(q / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize_group(events):
+    latencies = [e['latency'] for e in events if e.get('outcome') in ('ok', 'replay')]
+    return {
+        'calls': len(events),
+        'errors': sum(1 for e in events if e.get('outcome') == 'error'),
+        'cache_hits': sum(1 for e in events if e.get('outcome') == 'cache_hit'),
+        'retries': sum(e.get('retries', 0) for e in events),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'prompt_tokens': sum(e.get('prompt_tokens', 0) for e in events),
+        'cached_tokens': sum(e.get('cached_tokens', 0) for e in events),
+        'completion_tokens': sum(e.get('completion_tokens', 0) for e in events),
+        'cost': sum(e.get('cost', 0.0) for e in events),
+        'estimated': sum(1 for e in events if e.get('estimated')),
+    }
+
+
+def print_summary_table(title, key, events):
+    groups = {}
+    for event in events:
+        groups.setdefault(str(event.get(key, '-')), []).append(event)
+
+    print(f"\n=== {title} ===")
+    print(f"{key:>12} | {'calls':>6} | {'errors':>6} | {'cached':>6} | {'retries':>7} | "
+          f"{'p50 (s)':>8} | {'p95 (s)':>8} | {'prompt tok':>10} | {'compl tok':>9} | {'cost ($)':>9}")
+    for name in sorted(groups, key=lambda x: (len(x), x)):
+        s = summarize_group(groups[name])
+        print(f"{name:>12} | {s['calls']:>6} | {s['errors']:>6} | {s['cache_hits']:>6} | {s['retries']:>7} | "
+              f"{s['p50']:>8.2f} | {s['p95']:>8.2f} | {s['prompt_tokens']:>10} | {s['completion_tokens']:>9} | "
+              f"{s['cost']:>9.4f}")
+
+
+def summarize(path=TELEMETRY_PATH):
+    events = load_events(path)
+    if not events:
+        print(f"No LLM events found in {path}")
+        return
+
+    print_summary_table('LLM calls by suffix', 'suffix', events)
+    print_summary_table('LLM calls by problem', 'problem', events)
+    print_summary_table('LLM calls by model', 'model', events)
+    if any('tier' in event for event in events):
+        print_summary_table('LLM calls by model tier', 'tier', events)
+
+    total = summarize_group(events)
+    print(f"\nTotal: {total['calls']} calls, {total['errors']} errors, {total['cache_hits']} cache hits, "
+          f"p50 {total['p50']:.2f}s, p95 {total['p95']:.2f}s, "
+          f"{total['prompt_tokens']} prompt tokens ({total['cached_tokens']} cached), "
+          f"{total['completion_tokens']} completion tokens, ${total['cost']:.4f}")
+    if total['estimated']:
+        print(f"{total['estimated']} calls have locally counted (estimated) tokens: streams closed before "
+              f"their usage was reported")
+
+
+if __name__ == "__main__":
+    # Usage: python llm_telemetry.py [events.jsonl]
+    summarize(sys.argv[1] if len(sys.argv) > 1 else TELEMETRY_PATH)
@@ -1,268 +1,1234 @@
+import asyncio
+import hashlib
 import json
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 import os
 import re
+from collections import Counter
+
+from incidence_index import build_incidence_index
+from llm_batch import BatchRequests, run_batch
+from llm_client import (RETRYABLE_ERRORS, async_chat_completion, async_stream_json_completion, chat_completion,
+                        print_cache_stats, print_usage_stats, stream_json_completion)
+from llm_scheduler import Job, LargestFirstScheduler, print_projection
+from llm_telemetry import llm_tags
+from mapping_queue import MappingQueue, write_json_atomic
+from similarity_index import shortlist_candidates, shortlist_union
+from mapping_verification import format_violations, load_verifier, violation_score
+from model_tiers import DEFAULT_TIERS, TierStats
+from prompt_budget import CHARACTERS_PER_TOKEN, count_message_tokens, count_tokens, fits, pack_chunks, prompt_budget
+from structural_match import SIGNATURE_VERSION, format_constant, structural_prematch
 
 # Set your OpenAI API key
 client = OpenAI(api_key='your-api-key')
+async_client = AsyncOpenAI(api_key='your-api-key')
 
 
 # Base directory containing all the problems
 base_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy/'
 
-# Function to load data from a JSON file
+# Suffixes of the subproblem directories to map against the main problem
+SUFFIXES = ['_c', '_d', '_e', '_f', '_g', '_h', '_i', '_j', '_k', '_l']
+
+# Models tried in order, cheapest first. Variables are escalated to the next tier only when their
+# mapping fails validation (unparseable answer, unknown variables) or the numeric check.
+MODEL_TIERS = DEFAULT_TIERS
+# Model of the last tier, also used to re-prompt the mappings that fail the numeric check
+MODEL = MODEL_TIERS[-1]
+
+# Send requests through the async client, across variables and problem pairs at the same time
+USE_ASYNC = True
+# Maximum number of requests in flight when USE_ASYNC is enabled
+MAX_CONCURRENCY = 16
+# Global tokens-per-minute budget of a sweep: pairs are dispatched largest first (by the estimated
+# tokens of their first-tier requests), each once the budget has room for it
+TOKENS_PER_MINUTE = 150000
+
+# 'per_variable': one prompt per Problem 1 variable
+# 'joint': one prompt for all Problem 1 variables, per-variable prompts only for the ones that fail validation
+MAPPING_MODE = 'joint'
+# Constrain the joint answer with a JSON schema (needs a model with structured outputs, e.g. gpt-4o)
+STRUCTURED_OUTPUT = False
+
+# Nightly sweeps: send the first-tier requests of every pending pair as one Batch API job, ingest
+# the results into the response cache, then map the pairs as usual (escalations, fallbacks and
+# numeric repairs of the batch answers are sent interactively)
+BATCH_MODE = False
+
+# Stream the answers and close the stream as soon as the JSON object is complete, instead of waiting
+# for (and paying for) any text the model appends after it. A stream cut off that way never receives
+# its usage chunk, so its token counts are counted locally and marked estimated in the telemetry.
+STREAM_RESPONSES = False
+
+# Self-consistency for the per-variable prompts: number of samples requested in a single call and
+# their temperature. The mapping most samples agree on wins; ties are broken by the numeric check.
+# 1 disables voting (one deterministic answer).
+SAMPLES = 1
+SAMPLE_TEMPERATURE = 0.7
+
+# When Problem 2 has more than SHORTLIST_MIN_VARIABLES variables, each prompt only lists the
+# SHORTLIST_K Problem 2 variables most similar to the Problem 1 variable(s) (local TF-IDF over
+# descriptions and constraint contexts); a variable whose answer fails validation is asked again
+# with the full list. 0 disables the shortlist.
+SHORTLIST_K = 10
+SHORTLIST_MIN_VARIABLES = 20
+
+# Prompts that do not fit the context window of the model are split: the Problem 2 variables are
+# packed into chunks that fit, a candidate mapping is requested per chunk, and a short reduce request
+# picks the final mapping among the candidates. Tokens are counted locally (prompt_budget.py).
+CHUNKED_MAPPING = True
+# Completion tokens expected per Problem 1 variable: reserved when checking whether a joint prompt
+# fits, and used to project the size of a sweep
+COMPLETION_TOKENS_PER_VARIABLE = 80
+# Prompt tokens of the fixed text around one Problem 1 variable, for the projection of a sweep
+PROMPT_TOKENS_PER_VARIABLE = 60
+
+# Resolve variables whose constraint/objective columns in the instantiated models (model.lp) are
+# exact or scalar multiples of a single Problem 2 variable without calling the LLM
+STRUCTURAL_PREMATCH = True
+
+# Check the LLM mappings numerically before saving them: Problem 2's solution (solution.json) is
+# substituted into the mappings and Problem 1's instantiated model (model.lp) is evaluated. Variables
+# whose mapping violates a constraint, bound or integrality are re-prompted with the violations.
+NUMERIC_VERIFICATION = True
+# Re-prompting rounds per pair for the mappings that fail the numeric check
+MAX_REPAIR_ROUNDS = 2
+
+# Function to load data from a JSON file, together with its variable-to-constraint incidence index
 def load_problem_data(file_path):
     with open(file_path, 'r') as file:
         data = json.load(file)
         variables = data.get('variables', {})
         constraints = data.get('constraints', [])
         objective = data.get('objective', {})
-        return variables, constraints, objective
+        index = build_incidence_index(variables, constraints, objective)
+        return variables, constraints, objective, index
 
 
 # Function to extract constraints involving a specific variable
-def get_constraints_involving_variable(variable_name, constraints):
-    involved_constraints = []
-    for constraint in constraints:
-        formulation = constraint.get('formulation', '')
-        description = constraint.get('description', '')
-        if variable_name in formulation:
-            involved_constraints.append({
-                'description': description,
-                'formulation': formulation
-            })
-    return involved_constraints
-
-# Function to prepare the prompt for GPT using CoT approach
-# Function to prepare the prompt for GPT
-def create_prompt(var_name1, var_info1, variables2, constraints1, objective1, constraints2, objective2):
-    # Gather information for the variable from Problem 1
-    var_desc1 = var_info1.get('description', '')
-    constraints_involving_var1 = get_constraints_involving_variable(var_name1, constraints1)
-    objective_formulation1 = objective1.get('formulation', '')
-    var_in_objective1 = var_name1 in objective_formulation1
-
-    # Start constructing the prompt
-    prompt = f"""
-You are an AI language model assisting in mapping variables between two optimization problems by analyzing their roles in constraints and the objective function.
-
-**Variable from Problem 1:**
-- **Name:** {var_name1}
-- **Description:** {var_desc1}
-- **Constraints involving {var_name1}:**
-"""
-    for constraint in constraints_involving_var1:
-        prompt += f"  - Description: {constraint['description']}\n"
-        prompt += f"    Formulation: {constraint['formulation']}\n"
-
-    prompt += f"- **In Objective Function:** {'Yes' if var_in_objective1 else 'No'}\n"
-
-    # Provide information about variables from Problem 2
-    prompt += "\n**Variables from Problem 2:**\n"
-
-    for var_name2, var_info2 in variables2.items():
-        var_desc2 = var_info2.get('description', '')
-        constraints_involving_var2 = get_constraints_involving_variable(var_name2, constraints2)
-        objective_formulation2 = objective2.get('formulation', '')
-        var_in_objective2 = var_name2 in objective_formulation2
-
-        prompt += f"- **Name:** {var_name2}\n"
-        prompt += f"  **Description:** {var_desc2}\n"
-        prompt += f"  **Constraints involving {var_name2}:**\n"
-
-        for constraint in constraints_involving_var2:
-            prompt += f"    - Description: {constraint['description']}\n"
-            prompt += f"      Formulation: {constraint['formulation']}\n"
+def get_constraints_involving_variable(variable_name, constraints, index=None):
+    if index is None:
+        index = build_incidence_index({variable_name: {}}, constraints, {})
+    return index.constraints_involving(variable_name)
 
-        prompt += f"  **In Objective Function:** {'Yes' if var_in_objective2 else 'No'}\n\n"
+# System prompt shared by every mapping request
+SYSTEM_PROMPT = "You are an expert in optimization problems and variable mappings."
 
-    # Final instruction with explicit formatting requirement
-    prompt += f"""
-Based on the above information, find the best mapping from variables in Problem 2 for the variable '{var_name1}' from Problem 1. The mapping can be a linear combination of variables from Problem 2, possibly with constant multipliers. Your goal is to express '{var_name1}' in terms of variables from Problem 2, as accurately as possible, based on their roles in the constraints and objective functions.
+# Output instructions shared by every mapping request. They do not depend on the Problem 1 variable,
+# so they belong to the static prefix of the conversation.
+MAPPING_INSTRUCTIONS = """
+You will be given one or more variables from Problem 1. Based on the above information, find the best mapping from variables in Problem 2 for each of them. A mapping can be a linear combination of variables from Problem 2, possibly with constant multipliers. Your goal is to express each Problem 1 variable in terms of variables from Problem 2, as accurately as possible, based on their roles in the constraints and objective functions.
 
 **Important Instructions:**
 
-- **Provide only the mapping for '{var_name1}' as a JSON object.**
+- **Provide only the mappings for the requested Problem 1 variables as a single JSON object, with one key per requested variable.**
 - **Do not include any additional text, explanations, or formatting.**
 - **The JSON object must follow this exact structure:**
 
-{{
-  "{var_name1}": [
-    {{
+{
+  "problem_1_variable": [
+    {
       "constant": constant_value_1,
       "variable": "variable_name_1"
-    }},
-    {{
+    },
+    {
       "constant": constant_value_2,
       "variable": "variable_name_2"
-    }},
+    },
     ...
   ]
-}}
+}
 
 - **If there is only one term in the mapping, the list should contain a single object.**
 - **Use numerical values for constants (decimals), and enclose variable names in double quotes ("").**
 
-**Examples:**
+**Examples (for a Problem 1 variable named 'x'):**
 
 1. If the best mapping is '0.1*a', your response should be:
 
-{{
-  "{var_name1}": [
-    {{
+{
+  "x": [
+    {
       "constant": 0.1,
       "variable": "a"
-    }}
+    }
   ]
-}}
+}
 
 2. If the best mapping is '0.1*a + 0.01*b', your response should be:
 
-{{
-  "{var_name1}": [
-    {{
+{
+  "x": [
+    {
       "constant": 0.1,
       "variable": "a"
-    }},
-    {{
+    },
+    {
       "constant": 0.01,
       "variable": "b"
-    }}
+    }
   ]
-}}
+}
 
 3. If the best mapping is a single variable 'a' with a coefficient of 1, your response should be:
 
-{{
-  "{var_name1}": [
-    {{
+{
+  "x": [
+    {
       "constant": 1,
       "variable": "a"
-    }}
+    }
   ]
-}}
+}
 
 4. If there is no direct mapping, your response should be:
 
-{{
-  "{var_name1}": [
-    {{
+{
+  "x": [
+    {
       "constant": "none",
       "variable": "none"
-    }}
+    }
   ]
-}}
+}
 
-Please ensure your response is a valid JSON object that can be parsed by standard JSON parsers. 
+Please ensure your response is a valid JSON object that can be parsed by standard JSON parsers.
 """
-    return prompt
 
 
+# Function to describe a single Problem 2 variable with its constraints and objective role
+def describe_problem2_variable(var_name2, var_info2, index2):
+    parts = [
+        f"- **Name:** {var_name2}\n",
+        f"  **Description:** {var_info2.get('description', '')}\n",
+        f"  **Constraints involving {var_name2}:**\n"
+    ]
+    for constraint in index2.constraints_involving(var_name2):
+        parts.append(f"    - Description: {constraint['description']}\n")
+        parts.append(f"      Formulation: {constraint['formulation']}\n")
+    parts.append(f"  **In Objective Function:** {'Yes' if index2.in_objective(var_name2) else 'No'}\n\n")
+    return ''.join(parts)
 
-# Function to get the mapping using OpenAI ChatCompletion API
-import json
-import re
 
-# Function to get the mapping using OpenAI ChatCompletion API
-def get_variable_mapping(variables1, variables2, constraints1, objective1, constraints2, objective2):
-    mappings = {}
+# Function to describe every Problem 2 variable with its constraints and objective role
+def describe_problem2_variables(variables2, constraints2, objective2, index2=None):
+    if index2 is None:
+        index2 = build_incidence_index(variables2, constraints2, objective2)
+    parts = ["\n**Variables from Problem 2:**\n"]
+    for var_name2, var_info2 in variables2.items():
+        parts.append(describe_problem2_variable(var_name2, var_info2, index2))
+    return ''.join(parts)
+
+
+# Function to render the static context of a problem pair: the Problem 2 block and the output
+# instructions. It is identical for every Problem 1 variable, so it is rendered once per pair and
+# sent as the prefix of every request, where provider-side prefix caching can reuse it.
+def create_problem2_context(variables2, constraints2, objective2, index2=None):
+    return ''.join([
+        "\nYou are an AI language model assisting in mapping variables between two optimization problems "
+        "by analyzing their roles in constraints and the objective function.\n",
+        describe_problem2_variables(variables2, constraints2, objective2, index2),
+        MAPPING_INSTRUCTIONS
+    ])
+
+
+# Function to prepare the variable-specific suffix of the prompt for a single Problem 1 variable
+def create_prompt(var_name1, var_info1, constraints1, objective1, index1=None):
+    if index1 is None:
+        index1 = build_incidence_index({var_name1: var_info1}, constraints1, objective1)
+    # Gather information for the variable from Problem 1
+    parts = [
+        "**Variable from Problem 1:**\n",
+        f"- **Name:** {var_name1}\n",
+        f"- **Description:** {var_info1.get('description', '')}\n",
+        f"- **Constraints involving {var_name1}:**\n"
+    ]
+    for constraint in index1.constraints_involving(var_name1):
+        parts.append(f"  - Description: {constraint['description']}\n")
+        parts.append(f"    Formulation: {constraint['formulation']}\n")
+    parts.append(f"- **In Objective Function:** {'Yes' if index1.in_objective(var_name1) else 'No'}\n")
+
+    parts.append(
+        f"\nFind the best mapping from variables in Problem 2 for the variable '{var_name1}' from Problem 1. "
+        f"Provide only the mapping for '{var_name1}' as a JSON object with the single key \"{var_name1}\".\n"
+    )
+    return ''.join(parts)
+
+
+# Function to prepare the suffix asking for the mapping of every Problem 1 variable at once.
+# Problem 1 constraints are serialised once instead of once per variable.
+def create_joint_prompt(variables1, constraints1, objective1, index1=None):
+    if index1 is None:
+        index1 = build_incidence_index(variables1, constraints1, objective1)
+
+    parts = ["**Variables from Problem 1:**\n"]
     for var_name1, var_info1 in variables1.items():
-        prompt = create_prompt(var_name1, var_info1, variables2, constraints1, objective1, constraints2, objective2)
+        parts.append(f"- **Name:** {var_name1}\n")
+        parts.append(f"  **Description:** {var_info1.get('description', '')}\n")
+        parts.append(f"  **In Objective Function:** {'Yes' if index1.in_objective(var_name1) else 'No'}\n")
+
+    parts.append("\n**Constraints of Problem 1:**\n")
+    for constraint in constraints1:
+        parts.append(f"- Description: {constraint.get('description', '')}\n")
+        parts.append(f"  Formulation: {constraint.get('formulation', '')}\n")
+    parts.append(f"\n**Objective of Problem 1:** {objective1.get('formulation', '')}\n")
+
+    var_list = ', '.join(f"'{name}'" for name in variables1)
+    parts.append(
+        f"\nFind the best mapping from variables in Problem 2 for every variable from Problem 1 ({var_list}). "
+        "Provide the mappings for all of them as a single JSON object with one key per Problem 1 variable.\n"
+    )
+    return ''.join(parts)
+
+
+# Function to build the structured-output response format for the joint prompt: an object with
+# exactly one key per Problem 1 variable whose terms may only reference Problem 2 variables
+def joint_response_format(variables1, variables2):
+    term_schema = {
+        "type": "object",
+        "properties": {
+            "constant": {"anyOf": [{"type": "number"}, {"type": "string", "enum": ["none"]}]},
+            "variable": {"type": "string", "enum": list(variables2) + ["none"]}
+        },
+        "required": ["constant", "variable"],
+        "additionalProperties": False
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "variable_mappings",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {name: {"type": "array", "items": term_schema} for name in variables1},
+                "required": list(variables1),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+# Function to validate the mapping terms returned for a single variable
+def validate_mapping_terms(var_name1, mapping_terms, variables2):
+    if not mapping_terms:
+        print(f"Warning: No mapping found for variable '{var_name1}' in the GPT response.")
+        return None
+    if not isinstance(mapping_terms, list):
+        print(f"Warning: The mapping for variable '{var_name1}' is not a list of terms.")
+        return None
+
+    # Validate each term in the mapping
+    for term in mapping_terms:
+        if not isinstance(term, dict):
+            print(f"Warning: Invalid term {term} for variable '{var_name1}'.")
+            return None
+        constant = term.get('constant')
+        variable = term.get('variable')
+        if constant is None or variable is None:
+            print(f"Warning: Missing 'constant' or 'variable' in term {term} for variable '{var_name1}'.")
+            return None
+        if not isinstance(constant, (int, float)):
+            print(f"Warning: 'constant' must be a number in term {term} for variable '{var_name1}'.")
+            return None
+        if variable not in variables2:
+            print(f"Warning: The variable '{variable}' in the mapping is not in Problem 2 variables.")
+            return None
+    return mapping_terms
+
+
+# Function to parse and validate the GPT response for a single variable
+def parse_mapping_response(var_name1, content, variables2):
+    # Extract JSON object from the response using regex
+    match = re.search(r'\{.*\}', content, re.DOTALL)
+    if not match:
+        print(f"Error: Could not find JSON object in GPT response for variable '{var_name1}'.")
+        return None
+    json_str = match.group(0)
+    mapping_json = json.loads(json_str)
+    return validate_mapping_terms(var_name1, mapping_json.get(var_name1), variables2)
+
+
+# Function to parse the joint GPT response and validate the mapping of every Problem 1 variable.
+# Variables that are missing or fail validation are mapped to None.
+def parse_joint_mapping_response(content, variables1, variables2):
+    mappings = {var_name1: None for var_name1 in variables1}
+    match = re.search(r'\{.*\}', content, re.DOTALL)
+    if not match:
+        print("Error: Could not find JSON object in the joint GPT response.")
+        return mappings
+    try:
+        mapping_json = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error in the joint GPT response: {e}")
+        return mappings
+    if not isinstance(mapping_json, dict):
+        print("Error: The joint GPT response is not a JSON object.")
+        return mappings
+    for var_name1 in variables1:
+        mappings[var_name1] = validate_mapping_terms(var_name1, mapping_json.get(var_name1), variables2)
+    return mappings
+
+
+# Function to send a mapping request, streamed when STREAM_RESPONSES is set (the mapping prompts
+# always ask for a single JSON object)
+def mapping_completion(client, **kwargs):
+    # Several samples interleave in a stream; they are requested without streaming
+    if STREAM_RESPONSES and kwargs.get('n', 1) == 1:
+        return stream_json_completion(client, **kwargs)
+    return chat_completion(client, **kwargs)
+
+
+# Async counterpart of mapping_completion
+async def mapping_completion_async(async_client, **kwargs):
+    if STREAM_RESPONSES and kwargs.get('n', 1) == 1:
+        return await async_stream_json_completion(async_client, **kwargs)
+    return await async_chat_completion(async_client, **kwargs)
+
+
+# Function to build the chat messages: the static pair context goes first, the variable-specific
+# prompt is a short suffix
+def create_messages(context, prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + "\n" + context},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# Function to build the sampling options of a per-variable request
+def variable_request_options():
+    if SAMPLES > 1:
+        return {'temperature': SAMPLE_TEMPERATURE, 'n': SAMPLES}
+    return {'temperature': 0}  # More deterministic output
+
+
+# Function to canonicalise mapping terms for voting: one term per Problem 2 variable, sorted, with
+# rounded constants, so that equivalent answers written differently count as the same mapping
+def canonical_mapping(mapping_terms):
+    merged = {}
+    for term in mapping_terms:
+        merged[term['variable']] = merged.get(term['variable'], 0) + term['constant']
+    return tuple(sorted((variable, round(constant, 6)) for variable, constant in merged.items()))
+
+
+# Function to pick the mapping most samples agree on; ties are broken by the numeric check
+def vote_on_samples(var_name1, samples, verifier=None, known_mappings=None):
+    votes = Counter(canonical_mapping(terms) for terms in samples)
+    if not votes:
+        print(f"Warning: No valid sample for variable '{var_name1}'.")
+        return None
+    top = max(votes.values())
+    tied = [mapping for mapping, count in votes.items() if count == top]
+    print(f"Self-consistency for '{var_name1}': {len(samples)} valid samples, {len(votes)} distinct mappings, "
+          f"{len(tied)} with {top} votes")
+    if len(tied) > 1 and verifier is not None:
+        def score(mapping):
+            candidate = dict(known_mappings or {}, **{var_name1: canonical_terms(mapping)})
+            return violation_score(verifier.violations(candidate), var_name1)
+        tied.sort(key=score)
+    return canonical_terms(tied[0])
+
+
+# Function to turn a canonical mapping back into mapping terms
+def canonical_terms(mapping):
+    return [{"constant": format_constant(constant), "variable": variable} for variable, constant in mapping]
+
+
+# Function to read the mapping of a variable from the answer: the single answer, or the vote over
+# all the samples of the answer
+def mapping_from_response(var_name1, response, variables2, verifier=None, known_mappings=None):
+    if len(response.choices) == 1:
+        content = response.choices[0].message.content.strip()
+        print(f"GPT response for variable '{var_name1}':\n{content}\n")
+        return parse_mapping_response(var_name1, content, variables2)
+
+    samples = []
+    for position, choice in enumerate(response.choices):
+        content = (choice.message.content or '').strip()
+        print(f"GPT sample {position + 1} for variable '{var_name1}':\n{content}\n")
         try:
-            response = client.chat.completions.create(
-                model='gpt-4',
-                messages=[
-                    {"role": "system", "content": "You are an expert in optimization problems and variable mappings."},
-                    {"role": "user", "content": prompt}
-                ],
+            terms = parse_mapping_response(var_name1, content, variables2)
+        except json.JSONDecodeError as e:
+            print(f"JSON parsing error in sample {position + 1} for variable '{var_name1}': {e}")
+            terms = None
+        if terms is not None:
+            samples.append(terms)
+    return vote_on_samples(var_name1, samples, verifier, known_mappings)
+
+
+# Function to shortlist the Problem 2 candidates of every Problem 1 variable (None when Problem 2
+# is small enough to be listed in full)
+def candidate_shortlist(variables1, index1, variables2, index2):
+    if not SHORTLIST_K:
+        return None
+    return shortlist_candidates(variables1, index1, variables2, index2, SHORTLIST_K, SHORTLIST_MIN_VARIABLES)
+
+
+# Function to render the Problem 2 context restricted to the given candidates
+def shortlist_context(candidates, variables2, constraints2, objective2, index2):
+    return create_problem2_context({name: variables2[name] for name in candidates}, constraints2, objective2, index2)
+
+
+# Function to list the (candidates, context) to try for a variable: its shortlist first, then the full list
+def variable_contexts(var_name1, shortlist, context, variables2, constraints2, objective2, index2):
+    if shortlist is None or var_name1 not in shortlist:
+        return [(variables2, context)]
+    candidates = {name: variables2[name] for name in shortlist[var_name1]}
+    return [(candidates, shortlist_context(shortlist[var_name1], variables2, constraints2, objective2, index2)),
+            (variables2, context)]
+
+
+# Function to render the context of a joint prompt: the union of the shortlists of its variables
+def joint_context(variables1, index1, variables2, constraints2, objective2, index2, context):
+    shortlist = candidate_shortlist(variables1, index1, variables2, index2)
+    if shortlist is None:
+        return context
+    return shortlist_context(shortlist_union(shortlist, variables1), variables2, constraints2, objective2, index2)
+
+
+# Function to count the tokens of the context block of every Problem 2 variable
+def problem2_token_sizes(candidates, index2, model):
+    return {name: count_tokens(describe_problem2_variable(name, info, index2), model) for name, info in candidates.items()}
+
+
+# Function to pack the Problem 2 candidates into chunks whose context fits next to the prompt
+def problem2_chunks(candidates, sizes, constraints2, objective2, index2, prompt, model):
+    fixed = count_message_tokens(create_messages(create_problem2_context({}, constraints2, objective2, index2), prompt), model)
+    return pack_chunks({name: sizes[name] for name in candidates}, prompt_budget(model) - fixed)
+
+
+# Function to render a mapping as a readable linear expression, e.g. '0.5*a + 2*b'
+def format_mapping(mapping_terms):
+    return ' + '.join(f"{format_constant(term['constant'])}*{term['variable']}" for term in mapping_terms)
+
+
+# Function to prepare the reduce prompt: the variable prompt followed by the candidate mapping found
+# in each chunk of Problem 2 variables
+def create_reduce_prompt(var_name1, prompt, candidates):
+    parts = [
+        prompt,
+        "\nProblem 2 has too many variables to list at once, so they were split into chunks and the best "
+        "mapping was searched in each chunk. The candidate mappings are:\n"
+    ]
+    for position, mapping_terms in enumerate(candidates):
+        parts.append(f"- Candidate {position + 1}: {format_mapping(mapping_terms)}\n")
+    parts.append(
+        f"\nPick the best candidate for '{var_name1}', or combine them into a better mapping using only the "
+        "Problem 2 variables listed above.\n"
+    )
+    return ''.join(parts)
+
+
+# Function to read the candidate mapping of a chunk; a chunk without a suitable variable gives None
+def chunk_candidate(var_name1, response, chunk_variables):
+    content = response.choices[0].message.content.strip()
+    print(f"GPT chunk response for variable '{var_name1}':\n{content}\n")
+    try:
+        return parse_mapping_response(var_name1, content, chunk_variables)
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error in a chunk response for variable '{var_name1}': {e}")
+        return None
+
+
+# Function to build the reduce request over the chunk candidates, or to settle the mapping without
+# one. Returns (mapping_terms, None) when settled, otherwise (None, (reduce_variables, messages)).
+def reduce_request(var_name1, prompt, candidates, variables2, constraints2, objective2, index2):
+    candidates = [terms for terms in candidates if terms is not None]
+    print(f"Chunked mapping for '{var_name1}': {len(candidates)} candidate mappings")
+    if not candidates:
+        return None, None
+    if len(candidates) == 1:
+        return candidates[0], None
+    reduce_variables = {}
+    for terms in candidates:
+        for term in terms:
+            reduce_variables[term['variable']] = variables2[term['variable']]
+    context = create_problem2_context(reduce_variables, constraints2, objective2, index2)
+    messages = create_messages(context, create_reduce_prompt(var_name1, prompt, candidates))
+    return None, (reduce_variables, messages)
+
+
+# Function to map a variable whose prompt does not fit the context window: a candidate mapping per
+# chunk of Problem 2 variables, then a reduce request over the candidates
+def map_variable_in_chunks(var_name1, prompt, candidates, sizes, constraints2, objective2, index2, model,
+                           verifier=None, known_mappings=None):
+    chunks = problem2_chunks(candidates, sizes, constraints2, objective2, index2, prompt, model)
+    print(f"Prompt for '{var_name1}' exceeds the context window of {model}; mapping over {len(chunks)} chunks")
+    chunk_mappings = []
+    for chunk in chunks:
+        chunk_variables = {name: candidates[name] for name in chunk}
+        response = mapping_completion(
+            client,
+            model=model,
+            messages=create_messages(create_problem2_context(chunk_variables, constraints2, objective2, index2), prompt),
+            temperature=0  # More deterministic output
+        )
+        chunk_mappings.append(chunk_candidate(var_name1, response, chunk_variables))
+
+    mapping_terms, reduce = reduce_request(var_name1, prompt, chunk_mappings, candidates, constraints2, objective2, index2)
+    if reduce is None:
+        return mapping_terms
+    reduce_variables, messages = reduce
+    response = mapping_completion(client, model=model, messages=messages, **variable_request_options())
+    return mapping_from_response(var_name1, response, reduce_variables, verifier, known_mappings)
+
+
+# Async counterpart of map_variable_in_chunks: the chunks are mapped concurrently
+async def map_variable_in_chunks_async(var_name1, prompt, candidates, sizes, constraints2, objective2, index2, model,
+                                       semaphore, verifier=None, known_mappings=None):
+    chunks = problem2_chunks(candidates, sizes, constraints2, objective2, index2, prompt, model)
+    print(f"Prompt for '{var_name1}' exceeds the context window of {model}; mapping over {len(chunks)} chunks")
+
+    async def map_chunk(chunk):
+        chunk_variables = {name: candidates[name] for name in chunk}
+        async with semaphore:
+            response = await mapping_completion_async(
+                async_client,
+                model=model,
+                messages=create_messages(create_problem2_context(chunk_variables, constraints2, objective2, index2), prompt),
                 temperature=0  # More deterministic output
             )
-            content = response.choices[0].message.content.strip()
-            print(f"GPT response for variable '{var_name1}':\n{content}\n")
-
-            # Extract JSON object from the response using regex
-            match = re.search(r'\{.*\}', content, re.DOTALL)
-            if match:
-                json_str = match.group(0)
-                mapping_json = json.loads(json_str)
-                mapping_terms = mapping_json.get(var_name1)
-                if not mapping_terms:
-                    print(f"Warning: No mapping found for variable '{var_name1}' in the GPT response.")
-                    mappings[var_name1] = None
-                    continue
-            else:
-                print(f"Error: Could not find JSON object in GPT response for variable '{var_name1}'.")
+        return chunk_candidate(var_name1, response, chunk_variables)
+
+    chunk_mappings = await asyncio.gather(*(map_chunk(chunk) for chunk in chunks))
+    mapping_terms, reduce = reduce_request(var_name1, prompt, chunk_mappings, candidates, constraints2, objective2, index2)
+    if reduce is None:
+        return mapping_terms
+    reduce_variables, messages = reduce
+    async with semaphore:
+        response = await mapping_completion_async(async_client, model=model, messages=messages, **variable_request_options())
+    return mapping_from_response(var_name1, response, reduce_variables, verifier, known_mappings)
+
+
+# Function to check whether a joint prompt, with room for the mapping of every variable, fits the model
+def joint_prompt_fits(messages, variables1, model):
+    if not CHUNKED_MAPPING:
+        return True
+    return fits(messages, model, COMPLETION_TOKENS_PER_VARIABLE * len(variables1))
+
+
+# Function to get the mapping using OpenAI ChatCompletion API
+def get_variable_mapping(variables1, variables2, constraints1, objective1, constraints2, objective2,
+                         index1=None, index2=None, context=None, model=MODEL, verifier=None, known_mappings=None):
+    # Build the incidence indexes and the pair context once for the whole pair when the caller did not
+    if index1 is None:
+        index1 = build_incidence_index(variables1, constraints1, objective1)
+    if index2 is None:
+        index2 = build_incidence_index(variables2, constraints2, objective2)
+    if context is None:
+        context = create_problem2_context(variables2, constraints2, objective2, index2)
+    shortlist = candidate_shortlist(variables1, index1, variables2, index2)
+    sizes = None  # Token counts of the Problem 2 blocks, computed for the first prompt that needs chunking
+    mappings = {}
+    for var_name1, var_info1 in variables1.items():
+        prompt = create_prompt(var_name1, var_info1, constraints1, objective1, index1)
+        contexts = variable_contexts(var_name1, shortlist, context, variables2, constraints2, objective2, index2)
+        for attempt, (candidates, attempt_context) in enumerate(contexts):
+            if attempt > 0:
+                print(f"Falling back to the full list of Problem 2 variables for '{var_name1}'")
+            try:
+                messages = create_messages(attempt_context, prompt)
+                if CHUNKED_MAPPING and not fits(messages, model):
+                    if sizes is None:
+                        sizes = problem2_token_sizes(variables2, index2, model)
+                    mappings[var_name1] = map_variable_in_chunks(
+                        var_name1, prompt, candidates, sizes, constraints2, objective2, index2, model, verifier, known_mappings
+                    )
+                else:
+                    response = mapping_completion(client, model=model, messages=messages, **variable_request_options())
+                    mappings[var_name1] = mapping_from_response(var_name1, response, variables2, verifier, known_mappings)
+            except RETRYABLE_ERRORS:
+                # Out of retries: fail the whole pair instead of recording an empty mapping
+                raise
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error for variable '{var_name1}': {e}")
                 mappings[var_name1] = None
-                continue
-
-            # Validate each term in the mapping
-            valid = True
-            for term in mapping_terms:
-                constant = term.get('constant')
-                variable = term.get('variable')
-                if constant is None or variable is None:
-                    print(f"Warning: Missing 'constant' or 'variable' in term {term} for variable '{var_name1}'.")
-                    valid = False
-                    break
-                if not isinstance(constant, (int, float)):
-                    print(f"Warning: 'constant' must be a number in term {term} for variable '{var_name1}'.")
-                    valid = False
-                    break
-                if variable not in variables2:
-                    print(f"Warning: The variable '{variable}' in the mapping is not in Problem 2 variables.")
-                    valid = False
-                    break
-            if valid:
-                mappings[var_name1] = mapping_terms
-            else:
+            except Exception as e:
+                print(f"Error mapping variable '{var_name1}': {e}")
                 mappings[var_name1] = None
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error for variable '{var_name1}': {e}")
-            mappings[var_name1] = None
+            if mappings[var_name1] is not None:
+                break
+    return mappings
+
+
+# Async counterpart of get_variable_mapping: one request per variable, all in flight at once,
+# bounded by the shared semaphore
+async def get_variable_mapping_async(variables1, variables2, constraints1, objective1, constraints2, objective2, semaphore,
+                                     index1=None, index2=None, context=None, model=MODEL, verifier=None,
+                                     known_mappings=None):
+    if index1 is None:
+        index1 = build_incidence_index(variables1, constraints1, objective1)
+    if index2 is None:
+        index2 = build_incidence_index(variables2, constraints2, objective2)
+    if context is None:
+        context = create_problem2_context(variables2, constraints2, objective2, index2)
+
+    shortlist = candidate_shortlist(variables1, index1, variables2, index2)
+    sizes = {}  # Token counts of the Problem 2 blocks, computed for the first prompt that needs chunking
+
+    async def map_one(var_name1, var_info1):
+        prompt = create_prompt(var_name1, var_info1, constraints1, objective1, index1)
+        contexts = variable_contexts(var_name1, shortlist, context, variables2, constraints2, objective2, index2)
+        mapping_terms = None
+        for attempt, (candidates, attempt_context) in enumerate(contexts):
+            if attempt > 0:
+                print(f"Falling back to the full list of Problem 2 variables for '{var_name1}'")
+            try:
+                messages = create_messages(attempt_context, prompt)
+                if CHUNKED_MAPPING and not fits(messages, model):
+                    if not sizes:
+                        sizes.update(problem2_token_sizes(variables2, index2, model))
+                    mapping_terms = await map_variable_in_chunks_async(
+                        var_name1, prompt, candidates, sizes, constraints2, objective2, index2, model, semaphore,
+                        verifier, known_mappings
+                    )
+                else:
+                    async with semaphore:
+                        response = await mapping_completion_async(
+                            async_client, model=model, messages=messages, **variable_request_options()
+                        )
+                    mapping_terms = mapping_from_response(var_name1, response, variables2, verifier, known_mappings)
+            except RETRYABLE_ERRORS:
+                # Out of retries: fail the whole pair instead of recording an empty mapping
+                raise
+            except json.JSONDecodeError as e:
+                print(f"JSON parsing error for variable '{var_name1}': {e}")
+            except Exception as e:
+                print(f"Error mapping variable '{var_name1}': {e}")
+            if mapping_terms is not None:
+                break
+        return var_name1, mapping_terms
+
+    # Send the variables with the most constraints (the longest prompts) first
+    order = sorted(variables1, key=lambda name: len(index1.constraint_ids(name)), reverse=True)
+    results = dict(await asyncio.gather(*(map_one(name, variables1[name]) for name in order)))
+    # Keep the Problem 1 variable order in the output file
+    return {name: results[name] for name in variables1}
+
+
+# Function to get the mapping of all Problem 1 variables in one request, falling back to
+# per-variable prompts only for the variables whose joint answer fails validation
+def get_variable_mapping_joint(variables1, variables2, constraints1, objective1, constraints2, objective2,
+                               index1=None, index2=None, model=MODEL, verifier=None, known_mappings=None):
+    if index1 is None:
+        index1 = build_incidence_index(variables1, constraints1, objective1)
+    if index2 is None:
+        index2 = build_incidence_index(variables2, constraints2, objective2)
+    context = create_problem2_context(variables2, constraints2, objective2, index2)
+    prompt = create_joint_prompt(variables1, constraints1, objective1, index1)
+    messages = create_messages(joint_context(variables1, index1, variables2, constraints2, objective2, index2, context), prompt)
+    mappings = {var_name1: None for var_name1 in variables1}
+    if not joint_prompt_fits(messages, variables1, model):
+        print(f"Joint prompt exceeds the context window of {model}")
+    else:
+        try:
+            response = mapping_completion(
+                client,
+                model=model,
+                messages=messages,
+                temperature=0,  # More deterministic output
+                **joint_request_options(variables1, variables2)
+            )
+            content = response.choices[0].message.content.strip()
+            print(f"GPT joint response:\n{content}\n")
+            mappings = parse_joint_mapping_response(content, variables1, variables2)
+        except RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            print(f"Error in joint mapping request: {e}")
+
+    failed = {name: variables1[name] for name, terms in mappings.items() if terms is None}
+    if failed:
+        print(f"Falling back to per-variable prompts for: {', '.join(failed)}")
+        mappings.update(get_variable_mapping(
+            failed, variables2, constraints1, objective1, constraints2, objective2, index1, index2, context, model,
+            verifier, known_mappings
+        ))
+    return mappings
+
+
+# Async counterpart of get_variable_mapping_joint
+async def get_variable_mapping_joint_async(variables1, variables2, constraints1, objective1, constraints2, objective2, semaphore,
+                                           index1=None, index2=None, model=MODEL, verifier=None, known_mappings=None):
+    if index1 is None:
+        index1 = build_incidence_index(variables1, constraints1, objective1)
+    if index2 is None:
+        index2 = build_incidence_index(variables2, constraints2, objective2)
+    context = create_problem2_context(variables2, constraints2, objective2, index2)
+    prompt = create_joint_prompt(variables1, constraints1, objective1, index1)
+    messages = create_messages(joint_context(variables1, index1, variables2, constraints2, objective2, index2, context), prompt)
+    mappings = {var_name1: None for var_name1 in variables1}
+    if not joint_prompt_fits(messages, variables1, model):
+        print(f"Joint prompt exceeds the context window of {model}")
+    else:
+        try:
+            async with semaphore:
+                response = await mapping_completion_async(
+                    async_client,
+                    model=model,
+                    messages=messages,
+                    temperature=0,  # More deterministic output
+                    **joint_request_options(variables1, variables2)
+                )
+            content = response.choices[0].message.content.strip()
+            print(f"GPT joint response:\n{content}\n")
+            mappings = parse_joint_mapping_response(content, variables1, variables2)
+        except RETRYABLE_ERRORS:
+            raise
         except Exception as e:
-            print(f"Error mapping variable '{var_name1}': {e}")
-            mappings[var_name1] = None
+            print(f"Error in joint mapping request: {e}")
+
+    failed = {name: variables1[name] for name, terms in mappings.items() if terms is None}
+    if failed:
+        print(f"Falling back to per-variable prompts for: {', '.join(failed)}")
+        mappings.update(await get_variable_mapping_async(
+            failed, variables2, constraints1, objective1, constraints2, objective2, semaphore, index1, index2, context, model,
+            verifier, known_mappings
+        ))
     return mappings
 
 
-# Function to process all problem directories, focusing only on subdirectories ending with '_0'
+# Function to build the messages re-prompting a variable: the original conversation, the previous
+# mapping as the model's answer and the violations it caused
+def create_repair_messages(context, prompt, var_name1, mapping_terms, feedback):
+    return create_messages(context, prompt) + [
+        {"role": "assistant", "content": json.dumps({var_name1: mapping_terms})},
+        {"role": "user", "content": feedback}
+    ]
+
+
+# Function to re-prompt a single variable whose mapping failed the numeric check
+def repair_variable_mapping(var_name1, var_info1, mapping_terms, feedback, variables2, constraints1, objective1, index1, context,
+                            model=MODEL):
+    prompt = create_prompt(var_name1, var_info1, constraints1, objective1, index1)
+    try:
+        response = mapping_completion(
+            client,
+            model=model,
+            messages=create_repair_messages(context, prompt, var_name1, mapping_terms, feedback),
+            temperature=0  # More deterministic output
+        )
+        content = response.choices[0].message.content.strip()
+        print(f"GPT corrected response for variable '{var_name1}':\n{content}\n")
+        return parse_mapping_response(var_name1, content, variables2)
+    except RETRYABLE_ERRORS:
+        raise
+    except Exception as e:
+        print(f"Error re-prompting variable '{var_name1}': {e}")
+        return None
+
+
+# Async counterpart of repair_variable_mapping
+async def repair_variable_mapping_async(var_name1, var_info1, mapping_terms, feedback, variables2, constraints1, objective1, index1,
+                                        context, semaphore, model=MODEL):
+    prompt = create_prompt(var_name1, var_info1, constraints1, objective1, index1)
+    try:
+        async with semaphore:
+            response = await mapping_completion_async(
+                async_client,
+                model=model,
+                messages=create_repair_messages(context, prompt, var_name1, mapping_terms, feedback),
+                temperature=0  # More deterministic output
+            )
+        content = response.choices[0].message.content.strip()
+        print(f"GPT corrected response for variable '{var_name1}':\n{content}\n")
+        return parse_mapping_response(var_name1, content, variables2)
+    except RETRYABLE_ERRORS:
+        raise
+    except Exception as e:
+        print(f"Error re-prompting variable '{var_name1}': {e}")
+        return None
+
+
+# Function to find the repairable variables whose mapping fails the numeric check
+def failed_variables(violations, mappings, repairable):
+    return [name for name in repairable if name in violations and mappings.get(name) is not None]
+
+
+# Function to keep a corrected mapping only if it reduces the violations of its variable
+def accept_repair(verifier, mappings, violations, var_name1, new_terms):
+    if new_terms is None:
+        return
+    candidate = dict(mappings, **{var_name1: new_terms})
+    if violation_score(verifier.violations(candidate), var_name1) < violation_score(violations, var_name1):
+        mappings[var_name1] = new_terms
+    else:
+        print(f"Keeping the previous mapping for '{var_name1}': the corrected one does not reduce its violations")
+
+
+# Function to report the outcome of the numeric check of a pair
+def report_verification(verifier, mappings, repairable, sub_dir):
+    remaining = failed_variables(verifier.violations(mappings), mappings, repairable)
+    if remaining:
+        print(f"Numeric check for {sub_dir}: mappings of {', '.join(remaining)} still violate Problem 1's constraints")
+    else:
+        print(f"Numeric check for {sub_dir}: all evaluable mappings are feasible")
+
+
+# Function to check the mappings numerically and re-prompt the variables (among `repairable`) whose
+# mapping violates Problem 1's constraints, for up to MAX_REPAIR_ROUNDS rounds
+def verify_and_repair(verifier, mappings, repairable, variables1, variables2, constraints1, objective1, index1, context, sub_dir):
+    for round_number in range(MAX_REPAIR_ROUNDS):
+        violations = verifier.violations(mappings)
+        failed = failed_variables(violations, mappings, repairable)
+        if not failed:
+            break
+        print(f"Numeric check round {round_number + 1} for {sub_dir}: re-prompting {', '.join(failed)}")
+        for var_name1 in failed:
+            feedback = format_violations(var_name1, mappings[var_name1], violations[var_name1], verifier.solution_variables)
+            new_terms = repair_variable_mapping(
+                var_name1, variables1[var_name1], mappings[var_name1], feedback, variables2, constraints1, objective1, index1, context
+            )
+            accept_repair(verifier, mappings, violations, var_name1, new_terms)
+    report_verification(verifier, mappings, repairable, sub_dir)
+    return mappings
+
+
+# Async counterpart of verify_and_repair: the variables of a round are re-prompted concurrently
+async def verify_and_repair_async(verifier, mappings, repairable, variables1, variables2, constraints1, objective1, index1, context,
+                                  sub_dir, semaphore):
+    for round_number in range(MAX_REPAIR_ROUNDS):
+        violations = verifier.violations(mappings)
+        failed = failed_variables(violations, mappings, repairable)
+        if not failed:
+            break
+        print(f"Numeric check round {round_number + 1} for {sub_dir}: re-prompting {', '.join(failed)}")
+        repaired = await asyncio.gather(*(
+            repair_variable_mapping_async(
+                var_name1, variables1[var_name1], mappings[var_name1],
+                format_violations(var_name1, mappings[var_name1], violations[var_name1], verifier.solution_variables),
+                variables2, constraints1, objective1, index1, context, semaphore
+            )
+            for var_name1 in failed
+        ))
+        for var_name1, new_terms in zip(failed, repaired):
+            accept_repair(verifier, mappings, violations, var_name1, new_terms)
+    report_verification(verifier, mappings, repairable, sub_dir)
+    return mappings
+
+
+# Function to build the extra request options for the joint prompt
+def joint_request_options(variables1, variables2):
+    if STRUCTURED_OUTPUT:
+        return {'response_format': joint_response_format(variables1, variables2)}
+    return {}
+
+
+# Settings that change the mapping of a pair; they are part of the input hash of every pair
+def mapping_settings():
+    prompt = SYSTEM_PROMPT + MAPPING_INSTRUCTIONS
+    return {
+        'model_tiers': MODEL_TIERS,
+        'mapping_mode': MAPPING_MODE,
+        'structured_output': STRUCTURED_OUTPUT,
+        'structural_prematch': [STRUCTURAL_PREMATCH, SIGNATURE_VERSION],
+        'numeric_verification': NUMERIC_VERIFICATION,
+        'max_repair_rounds': MAX_REPAIR_ROUNDS,
+        'samples': [SAMPLES, SAMPLE_TEMPERATURE] if SAMPLES > 1 else 1,
+        'shortlist': [SHORTLIST_K, SHORTLIST_MIN_VARIABLES],
+        'chunked_mapping': CHUNKED_MAPPING,
+        'prompt': hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+    }
+
+
+# Function to print the mappings and write them to variable_mappings.json in the subproblem directory
+def save_variable_mappings(problem_dir, sub_dir, variable_mappings):
+    # Print the mappings
+    print(f"Variable Mappings for {problem_dir} and {sub_dir}:")
+    for var1, var2 in variable_mappings.items():
+        print(f"{var1} --> {var2}")
+    # Output the mappings to a JSON file
+    output_file = os.path.join(sub_dir, 'variable_mappings.json')
+    write_json_atomic(output_file, variable_mappings)
+    print(f"Mappings saved to {output_file}\n")
+
+
+# Statistics of the model tiers over the whole run
+tier_stats = TierStats(MODEL_TIERS)
+
+
+# Function to request the mappings of the given Problem 1 variables from one model. The verifier and
+# the mappings known so far break ties between self-consistency samples.
+def request_mappings(variables, variables2, constraints1, objective1, constraints2, objective2, index1, index2, model,
+                     verifier=None, known_mappings=None):
+    if MAPPING_MODE == 'joint':
+        return get_variable_mapping_joint(
+            variables, variables2, constraints1, objective1, constraints2, objective2, index1, index2, model,
+            verifier, known_mappings
+        )
+    return get_variable_mapping(
+        variables, variables2, constraints1, objective1, constraints2, objective2, index1, index2, model=model,
+        verifier=verifier, known_mappings=known_mappings
+    )
+
+
+# Async counterpart of request_mappings
+async def request_mappings_async(variables, variables2, constraints1, objective1, constraints2, objective2, semaphore,
+                                 index1, index2, model, verifier=None, known_mappings=None):
+    if MAPPING_MODE == 'joint':
+        return await get_variable_mapping_joint_async(
+            variables, variables2, constraints1, objective1, constraints2, objective2, semaphore, index1, index2, model,
+            verifier, known_mappings
+        )
+    return await get_variable_mapping_async(
+        variables, variables2, constraints1, objective1, constraints2, objective2, semaphore, index1, index2, model=model,
+        verifier=verifier, known_mappings=known_mappings
+    )
+
+
+# Function to find the variables of a tier whose mapping goes to the next tier: missing or invalid
+# answers, and mappings that fail the numeric check
+def variables_to_escalate(tier_variables, mappings, verifier):
+    escalate = [name for name in tier_variables if mappings.get(name) is None]
+    if verifier is not None:
+        violating = failed_variables(verifier.violations(mappings), mappings, tier_variables)
+        escalate += [name for name in violating if name not in escalate]
+    return escalate
+
+
+# Function to merge the answers of a tier; a failed answer does not overwrite a lower tier's mapping
+def merge_tier_mappings(mappings, tier_mappings):
+    mappings.update({name: terms for name, terms in tier_mappings.items() if terms is not None})
+
+
+# Function to print which variables move to the next tier
+def report_escalation(escalate, tier):
+    if escalate and tier + 1 < len(MODEL_TIERS):
+        print(f"Escalating {', '.join(escalate)} from {MODEL_TIERS[tier]} to {MODEL_TIERS[tier + 1]}")
+
+
+# Function to load the numeric verifier of a pair when the check is enabled
+def pair_verifier(problem_dir, sub_dir, variables1):
+    if not (variables1 and NUMERIC_VERIFICATION):
+        return None
+    verifier = load_verifier(problem_dir, sub_dir)
+    if verifier is None:
+        print(f"No model.lp or solution.json for {sub_dir}; mappings saved without the numeric check")
+    return verifier
+
+
+# Function to run the structural pre-pass of a pair; matches that fail the numeric check are dropped,
+# so the LLM maps those variables instead
+def checked_prematch(problem_dir, sub_dir, variables1, variables2, verifier):
+    if not STRUCTURAL_PREMATCH:
+        return {}
+    premapped = structural_prematch(problem_dir, sub_dir, variables1, variables2)
+    if verifier is not None and premapped:
+        rejected = failed_variables(verifier.violations(premapped), premapped, premapped)
+        if rejected:
+            print(f"Structural matches for {', '.join(rejected)} fail the numeric check in {sub_dir}; "
+                  f"sending them to the LLM")
+        premapped = {name: terms for name, terms in premapped.items() if name not in rejected}
+    return premapped
+
+
+# Function to get the mappings of a problem pair: the structural pre-pass first, then the model tiers
+# for the variables it could not resolve, then numeric repair with the last tier
+def map_pair(problem_dir, sub_dir, suffix):
+    # Load the main problem and subproblem data
+    variables1, constraints1, objective1, index1 = load_problem_data(os.path.join(problem_dir, 'problem_info.json'))
+    variables2, constraints2, objective2, index2 = load_problem_data(os.path.join(sub_dir, 'problem_info.json'))
+
+    verifier = pair_verifier(problem_dir, sub_dir, variables1)
+    premapped = checked_prematch(problem_dir, sub_dir, variables1, variables2, verifier)
+    unresolved = {name: info for name, info in variables1.items() if name not in premapped}
+    print(f"Structurally matched {len(premapped)} of {len(variables1)} variables for {sub_dir}")
+
+    # Keep the Problem 1 variable order in the output file
+    mappings = {name: premapped.get(name) for name in variables1}
+
+    # Get the variable mappings, tagging the LLM calls of this pair in the telemetry log
+    with llm_tags(problem=os.path.basename(problem_dir), suffix=suffix):
+        remaining = unresolved
+        for tier, model in enumerate(MODEL_TIERS):
+            if not remaining:
+                break
+            with tier_stats.timed(model, len(remaining)) as result, llm_tags(tier=tier):
+                merge_tier_mappings(mappings, request_mappings(
+                    remaining, variables2, constraints1, objective1, constraints2, objective2, index1, index2, model,
+                    verifier, mappings
+                ))
+                escalate = variables_to_escalate(remaining, mappings, verifier)
+                result['accepted'] = len(remaining) - len(escalate)
+            report_escalation(escalate, tier)
+            remaining = {name: variables1[name] for name in escalate}
+
+        if verifier is not None:
+            context = create_problem2_context(variables2, constraints2, objective2, index2)
+            mappings = verify_and_repair(
+                verifier, mappings, unresolved, variables1, variables2, constraints1, objective1, index1, context, sub_dir
+            )
+    return mappings
+
+
+# Async counterpart of map_pair
+async def map_pair_async(problem_dir, sub_dir, suffix, semaphore):
+    variables1, constraints1, objective1, index1 = load_problem_data(os.path.join(problem_dir, 'problem_info.json'))
+    variables2, constraints2, objective2, index2 = load_problem_data(os.path.join(sub_dir, 'problem_info.json'))
+
+    verifier = pair_verifier(problem_dir, sub_dir, variables1)
+    premapped = checked_prematch(problem_dir, sub_dir, variables1, variables2, verifier)
+    unresolved = {name: info for name, info in variables1.items() if name not in premapped}
+    print(f"Structurally matched {len(premapped)} of {len(variables1)} variables for {sub_dir}")
+
+    mappings = {name: premapped.get(name) for name in variables1}
+
+    with llm_tags(problem=os.path.basename(problem_dir), suffix=suffix):
+        remaining = unresolved
+        for tier, model in enumerate(MODEL_TIERS):
+            if not remaining:
+                break
+            with tier_stats.timed(model, len(remaining)) as result, llm_tags(tier=tier):
+                merge_tier_mappings(mappings, await request_mappings_async(
+                    remaining, variables2, constraints1, objective1, constraints2, objective2, semaphore,
+                    index1, index2, model, verifier, mappings
+                ))
+                escalate = variables_to_escalate(remaining, mappings, verifier)
+                result['accepted'] = len(remaining) - len(escalate)
+            report_escalation(escalate, tier)
+            remaining = {name: variables1[name] for name in escalate}
+
+        if verifier is not None:
+            context = create_problem2_context(variables2, constraints2, objective2, index2)
+            mappings = await verify_and_repair_async(
+                verifier, mappings, unresolved, variables1, variables2, constraints1, objective1, index1, context,
+                sub_dir, semaphore
+            )
+    return mappings
+
+
+# Function to build the first-tier requests of a pair exactly as map_pair sends them, as
+# (model, messages, options), for the batch mode
+def first_tier_requests(problem_dir, sub_dir):
+    variables1, constraints1, objective1, index1 = load_problem_data(os.path.join(problem_dir, 'problem_info.json'))
+    variables2, constraints2, objective2, index2 = load_problem_data(os.path.join(sub_dir, 'problem_info.json'))
+    verifier = pair_verifier(problem_dir, sub_dir, variables1)
+    premapped = checked_prematch(problem_dir, sub_dir, variables1, variables2, verifier)
+    unresolved = {name: info for name, info in variables1.items() if name not in premapped}
+    if not unresolved:
+        return []
+
+    context = create_problem2_context(variables2, constraints2, objective2, index2)
+    model = MODEL_TIERS[0]
+    if MAPPING_MODE == 'joint':
+        prompt = create_joint_prompt(unresolved, constraints1, objective1, index1)
+        options = dict(joint_request_options(unresolved, variables2), temperature=0)
+        pair_context = joint_context(unresolved, index1, variables2, constraints2, objective2, index2, context)
+        return [(model, create_messages(pair_context, prompt), options)]
+    shortlist = candidate_shortlist(unresolved, index1, variables2, index2)
+    return [
+        (model,
+         create_messages(variable_contexts(name, shortlist, context, variables2, constraints2, objective2, index2)[0][1],
+                         create_prompt(name, info, constraints1, objective1, index1)),
+         variable_request_options())
+        for name, info in unresolved.items()
+    ]
+
+
+# Function to answer the first-tier requests of all pending pairs with one Batch API job. The
+# results land in the response cache, where the regular processing picks them up.
+def prefetch_with_batch(base_dir):
+    queue = MappingQueue(base_dir, SUFFIXES, mapping_settings())
+    requests = BatchRequests()
+    for problem_dir, sub_dir, _ in queue.pending():
+        for model, messages, options in first_tier_requests(problem_dir, sub_dir):
+            requests.add(model, messages, **options)
+    run_batch(client, requests, 'mapping')
+
+
+# Function to estimate the prompt tokens of a Problem 1 constraint from its length
+def constraint_tokens(constraint):
+    return int((len(str(constraint.get('description', ''))) + len(str(constraint.get('formulation', ''))))
+               / CHARACTERS_PER_TOKEN)
+
+
+# Function to estimate the first-tier requests of a pair as a scheduler job, per Problem 1 variable
+# from the incidence index and from the size of Problem 2, without reading the models or rendering the
+# prompts. Structural matches are not known before the pair is mapped, so every variable is counted.
+def estimate_pair_job(problem_dir, sub_dir, suffix, instruction_tokens):
+    variables1, constraints1, objective1, index1 = load_problem_data(os.path.join(problem_dir, 'problem_info.json'))
+    model = MODEL_TIERS[0]
+    # Problem 2's static context; a larger one is mapped in chunks of at most one context window
+    problem2_size = os.path.getsize(os.path.join(sub_dir, 'problem_info.json'))
+    context_tokens = instruction_tokens + min(int(problem2_size / CHARACTERS_PER_TOKEN), prompt_budget(model))
+    variable_tokens = {
+        name: PROMPT_TOKENS_PER_VARIABLE + int(len(str(info.get('description', ''))) / CHARACTERS_PER_TOKEN)
+        for name, info in variables1.items()
+    }
+
+    if MAPPING_MODE == 'joint':
+        # The joint prompt lists every involved constraint once
+        constraint_ids = {i for name in variables1 for i in index1.constraint_ids(name)}
+        prompt_tokens = context_tokens + sum(variable_tokens.values()) + sum(
+            constraint_tokens(constraints1[i]) for i in constraint_ids
+        )
+        requests, samples = 1, 1
+    else:
+        prompt_tokens = sum(
+            context_tokens + tokens + sum(constraint_tokens(c) for c in index1.constraints_involving(name))
+            for name, tokens in variable_tokens.items()
+        )
+        requests, samples = len(variables1), variable_request_options().get('n', 1)
+    completion_tokens = COMPLETION_TOKENS_PER_VARIABLE * len(variables1) * samples
+    return Job(os.path.basename(sub_dir), model, requests, prompt_tokens, completion_tokens,
+               (problem_dir, sub_dir, suffix))
+
+
+# Function to estimate the first-tier requests of every pending pair as scheduler jobs
+def estimate_jobs(pending):
+    instruction_tokens = count_tokens(SYSTEM_PROMPT + MAPPING_INSTRUCTIONS, MODEL_TIERS[0])
+    jobs = [estimate_pair_job(problem_dir, sub_dir, suffix, instruction_tokens)
+            for problem_dir, sub_dir, suffix in pending]
+    print_projection(jobs, TOKENS_PER_MINUTE)
+    return jobs
+
+
+# Function to process all pending problem pairs one request at a time
 def process_all_problems(base_dir):
-    # Iterate over all directories in the base directory
-    for item in os.listdir(base_dir):
-        problem_dir = os.path.join(base_dir, item)
-        # Check if it's a directory
-        if os.path.isdir(problem_dir):
-            main_problem_file = os.path.join(problem_dir, 'problem_info.json')
-            # Check if the main problem_info.json exists
-            if os.path.isfile(main_problem_file):
-                # Load the main problem data
-                variables1, constraints1, objective1 = load_problem_data(main_problem_file)
-                # Now, find subdirectories that end with '_0' (e.g., 1_0, 2_0, etc.)
-                for sub_item in os.listdir(problem_dir):
-                    sub_dir = os.path.join(problem_dir, sub_item)
-                    if os.path.isdir(sub_dir) and sub_item.endswith('_d'):
-                        sub_problem_file = os.path.join(sub_dir, 'problem_info.json')
-                        # Check if the subproblem problem_info.json exists
-                        if os.path.isfile(sub_problem_file):
-                            # Load the subproblem data
-                            variables2, constraints2, objective2 = load_problem_data(sub_problem_file)
-                            # Get the variable mappings
-                            variable_mappings = get_variable_mapping(
-                                variables1, variables2, constraints1, objective1, constraints2, objective2
-                            )
-                            # Print the mappings
-                            print(f"Variable Mappings for {problem_dir} and {sub_dir}:")
-                            for var1, var2 in variable_mappings.items():
-                                print(f"{var1} --> {var2}")
-                            # Output the mappings to a JSON file
-                            output_file = os.path.join(sub_dir, 'variable_mappings.json')
-                            with open(output_file, 'w') as file:
-                                json.dump(variable_mappings, file, indent=4)
-                            print(f"Mappings saved to {output_file}\n")
-                        else:
-                            print(f"No problem_info.json found in {sub_dir}")
-            else:
-                print(f"No problem_info.json found in {problem_dir}")
-
-# Run the processing function
-process_all_problems(base_dir)
\ No newline at end of file
+    queue = MappingQueue(base_dir, SUFFIXES, mapping_settings())
+
+    def process_pair(job):
+        problem_dir, sub_dir, suffix = job.payload
+        try:
+            variable_mappings = map_pair(problem_dir, sub_dir, suffix)
+        except RETRYABLE_ERRORS as e:
+            print(f"Giving up on {sub_dir} after repeated API errors ({e}); mappings not saved, rerun to retry.")
+            queue.mark_failed(sub_dir, e)
+            return
+        save_variable_mappings(problem_dir, sub_dir, variable_mappings)
+        queue.mark_done(sub_dir)
+
+    LargestFirstScheduler(TOKENS_PER_MINUTE).run(estimate_jobs(queue.pending()), process_pair)
+
+
+# Function to process all pending problem pairs concurrently: every variable of every pair is sent
+# through the async client, with at most MAX_CONCURRENCY requests in flight. Pairs are started
+# largest first, under the TOKENS_PER_MINUTE budget.
+async def process_all_problems_async(base_dir):
+    queue = MappingQueue(base_dir, SUFFIXES, mapping_settings())
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async def process_pair(job):
+        problem_dir, sub_dir, suffix = job.payload
+        try:
+            variable_mappings = await map_pair_async(problem_dir, sub_dir, suffix, semaphore)
+        except RETRYABLE_ERRORS as e:
+            print(f"Giving up on {sub_dir} after repeated API errors ({e}); mappings not saved, rerun to retry.")
+            queue.mark_failed(sub_dir, e)
+            return
+        save_variable_mappings(problem_dir, sub_dir, variable_mappings)
+        queue.mark_done(sub_dir)
+
+    await LargestFirstScheduler(TOKENS_PER_MINUTE).run_async(estimate_jobs(queue.pending()), process_pair)
+
+
+if __name__ == "__main__":
+    if BATCH_MODE:
+        prefetch_with_batch(base_dir)
+    # Run the processing function
+    if USE_ASYNC:
+        asyncio.run(process_all_problems_async(base_dir))
+    else:
+        process_all_problems(base_dir)
+    print_cache_stats()
+    print_usage_stats()
+    tier_stats.print_summary('variables')
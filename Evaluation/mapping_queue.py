@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import time
+
+# Files whose content determines the mapping of a pair
+INPUT_FILES = ['problem_info.json', 'model.lp']
+# Problem 2 files the numeric verification reads; part of the hash when it is on, so a pair saved
+# unverified (or verified against an older solution) is mapped again once Problem 2 is (re-)solved
+VERIFICATION_FILES = ['solution.json']
+
+# Sidecar written next to variable_mappings.json with the hash of the inputs it was computed from
+META_FILE = 'variable_mappings.meta.json'
+MAPPINGS_FILE = 'variable_mappings.json'
+
+# Progress of the current sweep, kept in the base directory
+CHECKPOINT_FILE = 'mapping_progress.json'
+
+
+def write_json_atomic(path, data):
+    """
+    Writes JSON through a temporary file and a rename, so an interrupted run never leaves a
+    half-written file behind.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def enumerate_pairs(base_dir, suffixes):
+    """
+    Returns every (problem_dir, sub_dir, suffix) with a problem_info.json on both sides, for all the
+    given suffixes, in a stable order. Each directory is scanned once.
+    """
+    pairs = []
+    with os.scandir(base_dir) as problems:
+        problem_entries = sorted((e for e in problems if e.is_dir()), key=lambda e: e.name)
+    for problem in problem_entries:
+        if not os.path.isfile(os.path.join(problem.path, 'problem_info.json')):
+            print(f"No problem_info.json found in {problem.path}")
+            continue
+        with os.scandir(problem.path) as subs:
+            sub_entries = sorted((e for e in subs if e.is_dir()), key=lambda e: e.name)
+        for sub in sub_entries:
+            # Subproblem directories are named <problem>_<variant>, e.g. 12_d
+            suffix = next((s for s in suffixes if sub.name.endswith(s)), None)
+            if suffix is None:
+                continue
+            if os.path.isfile(os.path.join(sub.path, 'problem_info.json')):
+                pairs.append((problem.path, sub.path, suffix))
+            else:
+                print(f"No problem_info.json found in {sub.path}")
+    return pairs
+
+
+def input_hash(problem_dir, sub_dir, settings):
+    """
+    SHA-256 over the input files of both problems and the mapping settings (model, mode, prompt, ...).
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    files = [(directory, file_name) for directory in (problem_dir, sub_dir) for file_name in INPUT_FILES]
+    if settings.get('numeric_verification'):
+        files += [(sub_dir, file_name) for file_name in VERIFICATION_FILES]
+    for directory, file_name in files:
+        path = os.path.join(directory, file_name)
+        digest.update(file_name.encode('utf-8'))
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        else:
+            digest.update(b'<missing>')
+    return digest.hexdigest()
+
+
+class MappingQueue:
+    """
+    Work queue of (base, variant) mapping pairs. Pairs whose variable_mappings.json was computed from
+    the current inputs and settings are skipped; progress is checkpointed after every pair so an
+    interrupted sweep resumes where it stopped.
+    """
+
+    def __init__(self, base_dir, suffixes, settings):
+        self.base_dir = base_dir
+        self.settings = settings
+        self.checkpoint_path = os.path.join(base_dir, CHECKPOINT_FILE)
+        self.pairs = enumerate_pairs(base_dir, suffixes)
+        self.hashes = {sub_dir: input_hash(problem_dir, sub_dir, settings) for problem_dir, sub_dir, _ in self.pairs}
+
+        checkpoint = read_json(self.checkpoint_path) or {}
+        self.completed = checkpoint.get('completed', {})
+        self.failed = checkpoint.get('failed', {})
+
+    def is_current(self, sub_dir):
+        if not os.path.isfile(os.path.join(sub_dir, MAPPINGS_FILE)):
+            return False
+        meta = read_json(os.path.join(sub_dir, META_FILE)) or {}
+        return meta.get('input_hash') == self.hashes[sub_dir]
+
+    def pending(self):
+        """
+        Pairs that still need to be mapped, as (problem_dir, sub_dir, suffix).
+        """
+        pending = [pair for pair in self.pairs if not self.is_current(pair[1])]
+        print(f"Mapping queue: {len(self.pairs)} pairs, {len(self.pairs) - len(pending)} up to date, "
+              f"{len(pending)} to map")
+        return pending
+
+    def mark_done(self, sub_dir):
+        write_json_atomic(os.path.join(sub_dir, META_FILE), {
+            'input_hash': self.hashes[sub_dir],
+            'settings': self.settings,
+            'mapped_at': time.time()
+        })
+        self.completed[os.path.relpath(sub_dir, self.base_dir)] = self.hashes[sub_dir]
+        self.failed.pop(os.path.relpath(sub_dir, self.base_dir), None)
+        self._checkpoint()
+
+    def mark_failed(self, sub_dir, error):
+        self.failed[os.path.relpath(sub_dir, self.base_dir)] = str(error)[:500]
+        self._checkpoint()
+
+    def _checkpoint(self):
+        write_json_atomic(self.checkpoint_path, {
+            'updated_at': time.time(),
+            'total': len(self.pairs),
+            'completed': self.completed,
+            'failed': self.failed
+        })
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from structural_match import ELEMENT_NAME_PATTERN, MODEL_LP_FILE
+
+# Solution of Problem 2 written by step1_subp.py
+SOLUTION_FILE = 'solution.json'
+
+# Absolute and relative tolerance for a constraint, bound or integrality to count as satisfied
+FEASIBILITY_TOLERANCE = 1e-6
+
+# At most this many violations per variable are reported back to the LLM
+MAX_REPORTED_VIOLATIONS = 5
+
+
+def normalize_index(index):
+    """
+    Normalises an element index to the bracketed form used in LP column names: 3, "3", "(1, 2)" and
+    "1,2" become "[3]" and "[1,2]"; scalars use ''.
+    """
+    if index is None or index == '':
+        return ''
+    if isinstance(index, (list, tuple)):
+        return '[' + ','.join(str(i) for i in index) + ']'
+    return '[' + re.sub(r'[\s()\[\]\'"]', '', str(index)) + ']'
+
+
+def flatten_solution_value(value, prefix=()):
+    """
+    Flattens a solution.json value (number, {index: value} or nested lists) into {index: value}.
+    """
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten_solution_value(item, prefix + (re.sub(r'[\s()\'"]', '', str(key)),)))
+        return flat
+    if isinstance(value, list):
+        flat = {}
+        for position, item in enumerate(value):
+            flat.update(flatten_solution_value(item, prefix + (str(position),)))
+        return flat
+    if isinstance(value, (int, float)):
+        return {normalize_index(','.join(prefix)) if prefix else '': float(value)}
+    return {}
+
+
+def mapped_values(terms, solution_variables):
+    """
+    Values of a Problem 1 variable implied by its mapping terms and Problem 2's solution, as
+    {index: value}, or None when a term cannot be evaluated. As in step2_map.py, a scalar term only
+    contributes to a scalar Problem 1 variable.
+    """
+    if not terms or not isinstance(terms, list):
+        return None
+    values = {}
+    for term in terms:
+        if not isinstance(term, dict) or not isinstance(term.get('constant'), (int, float)):
+            return None
+        solution_value = solution_variables.get(term.get('variable'))
+        if solution_value is None:
+            return None
+        for index, value in flatten_solution_value(solution_value).items():
+            values[index] = values.get(index, 0.0) + term['constant'] * value
+    return values
+
+
+class MappingVerifier:
+    """
+    Checks proposed mappings numerically: Problem 2's optimal solution is pushed through the mappings
+    and the resulting point is evaluated against Problem 1's instantiated model (constraints, bounds
+    and integrality). A correct mapping of an equivalent formulation yields a feasible point.
+    """
+
+    def __init__(self, lp_path, solution_variables):
+        # Imported here so that mapping runs without a Gurobi installation when no LP files exist
+        import gurobipy as gp
+
+        model = gp.read(lp_path)
+        model_vars = model.getVars()
+        constrs = model.getConstrs()
+        self.columns = []
+        self.owners = []
+        for var in model_vars:
+            match = ELEMENT_NAME_PATTERN.match(var.VarName)
+            name, index = (match.group(1), match.group(2) or '') if match else (var.VarName, '')
+            self.columns.append((name, index))
+            self.owners.append(name)
+        self.column_names = [var.VarName for var in model_vars]
+        self.lower = np.array([var.LB for var in model_vars], dtype=float)
+        self.upper = np.array([var.UB for var in model_vars], dtype=float)
+        self.integer = np.array([var.VType in (gp.GRB.INTEGER, gp.GRB.BINARY) for var in model_vars], dtype=bool)
+
+        position = {var.VarName: i for i, var in enumerate(model_vars)}
+        self.A = np.zeros((len(constrs), len(model_vars)))
+        for i, constr in enumerate(constrs):
+            row = model.getRow(constr)
+            for k in range(row.size()):
+                self.A[i, position[row.getVar(k).VarName]] += row.getCoeff(k)
+        self.rhs = np.array([constr.RHS for constr in constrs], dtype=float)
+        self.senses = np.array([constr.Sense for constr in constrs])
+        self.row_names = [constr.ConstrName for constr in constrs]
+        model.dispose()
+
+        self.solution_variables = solution_variables
+
+    def point(self, mappings):
+        """
+        Problem 1 column values implied by the mappings; NaN where a column is not mapped.
+        """
+        values = {name: mapped_values(terms, self.solution_variables) for name, terms in mappings.items()}
+        x = np.full(len(self.columns), np.nan)
+        for j, (name, index) in enumerate(self.columns):
+            var_values = values.get(name)
+            if var_values is not None and index in var_values:
+                x[j] = var_values[index]
+        return x
+
+    def violations(self, mappings):
+        """
+        Returns {Problem 1 variable: [(violation amount, description)]}. A violated constraint is
+        reported for every variable appearing in it; constraints with unmapped columns are skipped.
+        """
+        x = self.point(mappings)
+        known = ~np.isnan(x)
+        violations = {}
+
+        def report(j_columns, amount, description):
+            for name in {self.owners[j] for j in j_columns}:
+                violations.setdefault(name, []).append((float(amount), description))
+
+        # Rows whose columns are all mapped
+        nonzero = self.A != 0
+        evaluable = ~(nonzero & ~known).any(axis=1)
+        lhs = self.A[:, known] @ x[known]
+        residual = lhs - self.rhs
+        amount = np.where(self.senses == '<', np.maximum(residual, 0),
+                          np.where(self.senses == '>', np.maximum(-residual, 0), np.abs(residual)))
+        tolerance = FEASIBILITY_TOLERANCE * (1 + np.abs(self.rhs))
+        for i in np.flatnonzero(evaluable & (amount > tolerance)):
+            columns = np.flatnonzero(nonzero[i])
+            report(columns, amount[i], self.describe_row(i, x, lhs[i]))
+
+        # Bounds and integrality of the mapped columns
+        for j in np.flatnonzero(known):
+            value = x[j]
+            if value < self.lower[j] - FEASIBILITY_TOLERANCE * (1 + abs(self.lower[j])):
+                report([j], self.lower[j] - value, f"{self.column_names[j]} = {value:.6g} is below its lower bound {self.lower[j]:.6g}")
+            elif value > self.upper[j] + FEASIBILITY_TOLERANCE * (1 + abs(self.upper[j])):
+                report([j], value - self.upper[j], f"{self.column_names[j]} = {value:.6g} is above its upper bound {self.upper[j]:.6g}")
+            if self.integer[j] and abs(value - round(value)) > FEASIBILITY_TOLERANCE:
+                report([j], abs(value - round(value)), f"{self.column_names[j]} = {value:.6g} must be integer")
+
+        for name in violations:
+            violations[name].sort(key=lambda v: -v[0])
+        return violations
+
+    def describe_row(self, i, x, lhs):
+        terms = ' + '.join(f"{self.A[i, j]:g}*{self.column_names[j]}" for j in np.flatnonzero(self.A[i]))
+        sense = {'<': '<=', '>': '>=', '=': '='}[self.senses[i]]
+        values = ', '.join(f"{self.column_names[j]} = {x[j]:.6g}" for j in np.flatnonzero(self.A[i]))
+        return (f"{self.row_names[i]}: {terms} {sense} {self.rhs[i]:g} evaluates to {lhs:.6g} "
+                f"(with {values})")
+
+
+def load_verifier(problem_dir, sub_dir):
+    """
+    Verifier for a problem pair, or None when Problem 1's model.lp or Problem 2's solution.json is
+    missing (the mappings are then saved unverified).
+    """
+    lp_path = os.path.join(problem_dir, MODEL_LP_FILE)
+    solution_path = os.path.join(sub_dir, SOLUTION_FILE)
+    if not (os.path.isfile(lp_path) and os.path.isfile(solution_path)):
+        return None
+    try:
+        with open(solution_path, 'r') as f:
+            solution_variables = json.load(f).get('variables', {})
+        return MappingVerifier(lp_path, solution_variables)
+    except Exception as e:
+        print(f"Could not load the verification data for {problem_dir} and {sub_dir}: {e}")
+        return None
+
+
+def violation_score(violations, name):
+    return sum(amount for amount, _ in violations.get(name, []))
+
+
+def format_violations(var_name, terms, violations, solution_variables):
+    """
+    Feedback message for the LLM about a mapping that failed the numeric check.
+    """
+    values = mapped_values(terms, solution_variables) or {}
+    shown = ', '.join(f"{var_name}{index} = {value:.6g}" for index, value in sorted(values.items())[:10])
+    lines = [
+        f"Your mapping for '{var_name}' was {json.dumps(terms)}.",
+        f"Substituting Problem 2's optimal solution into it gives {shown or 'no values'}, which violates "
+        f"Problem 1's instantiated model:"
+    ]
+    for amount, description in violations[:MAX_REPORTED_VIOLATIONS]:
+        lines.append(f"- {description}; violated by {amount:.6g}")
+    lines.append(
+        f"\nPlease correct the mapping for '{var_name}'. Provide only the mapping for '{var_name}' as a JSON "
+        f"object with the single key \"{var_name}\", in the same format as before."
+    )
+    return '\n'.join(lines)
@@ -0,0 +1,347 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint, for offline runs and load tests of the
+mapping pipeline. Requests recorded in a cassette (see llm_cassette.py) are answered with the
+recorded response; other requests get a fixed fallback answer. The Files and Batches endpoints used
+by llm_batch.py are supported as well; a batch completes after --batch-delay seconds.
+
+    python mock_llm_server.py --cassette llm_cassette.jsonl --port 8000 --latency recorded
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 python mapping_finder_.py
+
+--rpm makes the server answer with 429s above the given requests per minute, so that the rate
+limiter and the retry loop of llm_client.py can be exercised without spending anything.
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_cache import cache_key
+from llm_cassette import CASSETTE_PATH, Cassette, CassetteMiss, replay_delay
+
+# Answer for requests that are not in the cassette; a mapping that maps nothing
+FALLBACK_CONTENT = '{}'
+
+# Characters per streamed chunk
+STREAM_CHUNK_CHARACTERS = 16
+
+
+def estimate_tokens(text):
+    return max(len(text) // 4, 1)
+
+
+def fallback_response(body, content):
+    prompt_tokens = estimate_tokens(json.dumps(body.get('messages', [])))
+    completion_tokens = estimate_tokens(content)
+    choices = [
+        {
+            'index': i,
+            'message': {'role': 'assistant', 'content': content},
+            'finish_reason': 'stop',
+            'logprobs': None
+        }
+        for i in range(body.get('n', 1))
+    ]
+    return {
+        'id': f'chatcmpl-mock-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'mock'),
+        'choices': choices,
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens * len(choices),
+            'total_tokens': prompt_tokens + completion_tokens * len(choices)
+        }
+    }
+
+
+class RequestWindow:
+    """
+    Sliding one-minute window of request times, for the simulated rate limit.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.times = []
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """
+        Returns (admitted, remaining requests, seconds until a slot frees up).
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.times = [t for t in self.times if now - t < 60]
+            if len(self.times) >= self.requests_per_minute:
+                return False, 0, 60 - (now - self.times[0])
+            self.times.append(now)
+            return True, self.requests_per_minute - len(self.times), 0.0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = 'MockLLM/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_not_found(self):
+        self.send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path in ('/v1/chat/completions', '/chat/completions'):
+            self.chat_completion(json.loads(self.read_body() or b'{}'))
+        elif path in ('/v1/files', '/files'):
+            self.upload_file()
+        elif path in ('/v1/batches', '/batches'):
+            self.create_batch(json.loads(self.read_body() or b'{}'))
+        else:
+            self.send_not_found()
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?')[0].split('/') if part and part != 'v1']
+        if len(parts) == 2 and parts[0] == 'batches' and parts[1] in self.server.batches:
+            self.send_json(200, self.server.batches[parts[1]])
+        elif len(parts) == 2 and parts[0] == 'files' and parts[1] in self.server.files:
+            self.send_json(200, self.server.files[parts[1]]['object'])
+        elif len(parts) == 3 and parts[0] == 'files' and parts[2] == 'content' and parts[1] in self.server.files:
+            data = self.server.files[parts[1]]['content']
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_not_found()
+
+    def upload_file(self):
+        # Multipart form with a 'purpose' field and a 'file' part
+        content_type = self.headers.get('Content-Type', '')
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + self.read_body()
+        )
+        fields = {}
+        filename = 'upload.jsonl'
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename():
+                filename = part.get_filename()
+            fields[name] = part.get_payload(decode=True)
+        purpose = (fields.get('purpose') or b'batch').decode('utf-8')
+        self.send_json(200, self.server.add_file(fields.get('file') or b'', filename, purpose))
+
+    def create_batch(self, body):
+        if body.get('input_file_id') not in self.server.files:
+            self.send_json(400, {'error': {'message': 'Unknown input_file_id', 'type': 'invalid_request_error'}})
+            return
+        self.send_json(200, self.server.create_batch(body))
+
+    def chat_completion(self, body):
+
+        headers = {}
+        window = self.server.window
+        if window is not None:
+            admitted, remaining, reset = window.admit()
+            headers = {
+                'x-ratelimit-limit-requests': window.requests_per_minute,
+                'x-ratelimit-remaining-requests': remaining,
+                'x-ratelimit-reset-requests': f'{reset:.3f}s'
+            }
+            if not admitted:
+                headers['retry-after'] = f'{reset:.3f}'
+                self.send_json(429, {'error': {'message': 'Rate limit reached (mock server)',
+                                               'type': 'requests', 'code': 'rate_limit_exceeded'}}, headers)
+                return
+
+        response, delay = self.server.answer(body)
+        time.sleep(delay + random.uniform(0, self.server.jitter))
+        if body.get('stream'):
+            self.send_stream(response, headers)
+        else:
+            self.send_json(200, response, headers)
+
+    def send_stream(self, response, headers):
+        """
+        Sends the response as server-sent chat.completion.chunk events, a few characters at a time.
+        The client may close the connection before the end (see llm_client.stream_json_completion).
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        content = response['choices'][0]['message']['content'] or ''
+        pieces = [content[i:i + STREAM_CHUNK_CHARACTERS] for i in range(0, len(content), STREAM_CHUNK_CHARACTERS)]
+        try:
+            for position, piece in enumerate(pieces + [None]):
+                chunk = {
+                    'id': response.get('id', 'chatcmpl-mock'),
+                    'object': 'chat.completion.chunk',
+                    'created': response.get('created', int(time.time())),
+                    'model': response.get('model', 'mock'),
+                    'choices': [{
+                        'index': 0,
+                        'delta': {'content': piece} if piece is not None else {},
+                        'finish_reason': None if piece is not None else 'stop'
+                    }]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                if self.server.stream_interval:
+                    time.sleep(self.server.stream_interval)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.server.count('streams_completed')
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.count('streams_cancelled')
+        self.close_connection = True
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cassette, latency=None, jitter=0.0, requests_per_minute=None,
+                 fallback=FALLBACK_CONTENT, verbose=False, stream_interval=0.0, batch_delay=0.0):
+        super().__init__(address, MockHandler)
+        self.cassette = cassette
+        self.latency = latency
+        self.jitter = jitter
+        self.window = RequestWindow(requests_per_minute) if requests_per_minute else None
+        self.fallback = fallback
+        self.verbose = verbose
+        self.stream_interval = stream_interval
+        self.batch_delay = batch_delay
+        self.files = {}
+        self.batches = {}
+        self.counts = {'hits': 0, 'misses': 0, 'streams_completed': 0, 'streams_cancelled': 0}
+        self._count_lock = threading.Lock()
+
+    def count(self, name):
+        with self._count_lock:
+            self.counts[name] += 1
+
+    def answer(self, body):
+        """
+        Returns (response, simulated delay) for a chat completion request body.
+        """
+        # Same key as llm_client.chat_completion, so cassettes recorded there are found here
+        extra = {k: v for k, v in body.items() if k not in ('model', 'messages', 'temperature', 'stream', 'stream_options')}
+        key = cache_key(body.get('model'), body.get('messages'), body.get('temperature'), **extra)
+        try:
+            entry = self.cassette.lookup(key)
+            self.count('hits')
+            return entry['response'], replay_delay(entry, self.latency)
+        except CassetteMiss:
+            self.count('misses')
+            return fallback_response(body, self.fallback), replay_delay({}, self.latency if self.latency != 'recorded' else None)
+
+    def add_file(self, content, filename, purpose):
+        file_id = f'file-mock-{uuid.uuid4().hex[:24]}'
+        file_object = {
+            'id': file_id,
+            'object': 'file',
+            'bytes': len(content),
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose,
+            'status': 'processed'
+        }
+        self.files[file_id] = {'object': file_object, 'content': content}
+        return file_object
+
+    def create_batch(self, body):
+        batch_id = f'batch_mock_{uuid.uuid4().hex[:24]}'
+        lines = [json.loads(line) for line in self.files[body['input_file_id']]['content'].decode('utf-8').splitlines()
+                 if line.strip()]
+        batch = {
+            'id': batch_id,
+            'object': 'batch',
+            'endpoint': body.get('endpoint', '/v1/chat/completions'),
+            'input_file_id': body['input_file_id'],
+            'completion_window': body.get('completion_window', '24h'),
+            'status': 'in_progress',
+            'created_at': int(time.time()),
+            'in_progress_at': int(time.time()),
+            'output_file_id': None,
+            'error_file_id': None,
+            'metadata': body.get('metadata'),
+            'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0}
+        }
+        self.batches[batch_id] = batch
+        threading.Thread(target=self.run_batch, args=(batch, lines), daemon=True).start()
+        return batch
+
+    def run_batch(self, batch, lines):
+        time.sleep(self.batch_delay)
+        output = []
+        for line in lines:
+            response, _ = self.answer(line.get('body', {}))
+            output.append(json.dumps({
+                'id': f'batch_req_{uuid.uuid4().hex[:24]}',
+                'custom_id': line.get('custom_id'),
+                'response': {'status_code': 200, 'request_id': uuid.uuid4().hex, 'body': response},
+                'error': None
+            }))
+        output_file = self.add_file(('\n'.join(output) + '\n').encode('utf-8'), f"{batch['id']}_output.jsonl", 'batch_output')
+        batch['request_counts']['completed'] = len(lines)
+        batch['output_file_id'] = output_file['id']
+        batch['completed_at'] = int(time.time())
+        batch['status'] = 'completed'
+
+
+def parse_latency(value):
+    if value is None or value == 'recorded':
+        return value
+    return float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock OpenAI chat completions server backed by an LLM cassette.')
+    parser.add_argument('--cassette', default=CASSETTE_PATH, help='cassette file recorded with EQUIVAMAP_LLM_MODE=record')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', default=None, help="'recorded' or a fixed number of seconds per response")
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra uniform random latency in seconds')
+    parser.add_argument('--rpm', type=int, default=None, help='answer with 429 above this many requests per minute')
+    parser.add_argument('--fallback', default=FALLBACK_CONTENT, help='answer for requests not in the cassette')
+    parser.add_argument('--stream-interval', type=float, default=0.0, help='seconds between streamed chunks')
+    parser.add_argument('--batch-delay', type=float, default=0.0, help='seconds before a submitted batch completes')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    cassette = Cassette(args.cassette)
+    server = MockServer((args.host, args.port), cassette, parse_latency(args.latency), args.jitter,
+                        args.rpm, args.fallback, args.verbose, args.stream_interval, args.batch_delay)
+    print(f"Serving {len(cassette)} recorded responses on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Cassette hits: {server.counts['hits']}, misses: {server.counts['misses']}; streams completed: "
+              f"{server.counts['streams_completed']}, cancelled by the client: {server.counts['streams_cancelled']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+
+# Models tried in order, cheapest and fastest first. A request moves to the next tier only when the
+# answer fails validation, so the expensive model only sees the hard cases.
+DEFAULT_TIERS = ['gpt-4o-mini', 'gpt-4o', 'gpt-4']
+
+
+class TierStats:
+    """
+    Per-tier counts of the items (variables, problem pairs) sent to each model, how many of them were
+    accepted there, and the wall time spent in each tier.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = list(tiers)
+        self.attempted = {model: 0 for model in self.tiers}
+        self.accepted = {model: 0 for model in self.tiers}
+        self.seconds = {model: [] for model in self.tiers}
+
+    def record(self, model, attempted, accepted, seconds):
+        self.attempted[model] = self.attempted.get(model, 0) + attempted
+        self.accepted[model] = self.accepted.get(model, 0) + accepted
+        self.seconds.setdefault(model, []).append(seconds)
+
+    @contextmanager
+    def timed(self, model, attempted):
+        """
+        Times a tier stage; the block sets result['accepted'] to the number of accepted items.
+        """
+        result = {'accepted': 0}
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            self.record(model, attempted, result['accepted'], time.perf_counter() - start)
+
+    def print_summary(self, unit='items'):
+        if not any(self.attempted.values()):
+            return
+        print(f"\n=== Model tiers ({unit}) ===")
+        print(f"{'tier':>4} | {'model':>16} | {'sent':>6} | {'accepted':>8} | {'hit rate':>8} | {'mean (s)':>8} | {'total (s)':>9}")
+        for position, model in enumerate(self.tiers):
+            attempted = self.attempted.get(model, 0)
+            accepted = self.accepted.get(model, 0)
+            seconds = self.seconds.get(model, [])
+            hit_rate = accepted / attempted if attempted else 0.0
+            mean = sum(seconds) / len(seconds) if seconds else 0.0
+            print(f"{position:>4} | {model:>16} | {attempted:>6} | {accepted:>8} | {hit_rate:>8.0%} | "
+                  f"{mean:>8.2f} | {sum(seconds):>9.2f}")
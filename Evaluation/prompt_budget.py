@@ -0,0 +1,85 @@
+try:
+    import tiktoken
+except ImportError:  # The character estimate below is used instead
+    tiktoken = None
+
+# Context window (prompt + completion tokens) of the models used by the mapping scripts;
+# unknown models get DEFAULT_CONTEXT_WINDOW
+CONTEXT_WINDOWS = {
+    'gpt-4o-mini': 128000,
+    'gpt-4o': 128000,
+    'gpt-4-turbo': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens kept free for the completion
+COMPLETION_RESERVE = 1024
+
+# Per-message overhead of the chat format (role and separators) and the priming of the reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_OVERHEAD_TOKENS = 3
+
+# Characters per token when tiktoken is not installed; slightly pessimistic for English prose
+CHARACTERS_PER_TOKEN = 3.5
+
+_encodings = {}
+
+
+def _encoding(model):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding('o200k_base')
+    return _encodings[model]
+
+
+def count_tokens(text, model):
+    """
+    Number of tokens of the text for the model, counted locally: with tiktoken when it is
+    installed, otherwise estimated from the number of characters.
+    """
+    if not text:
+        return 0
+    if tiktoken is None:
+        return int(len(text) / CHARACTERS_PER_TOKEN) + 1
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model):
+    return sum(MESSAGE_OVERHEAD_TOKENS + count_tokens(message['content'], model) for message in messages) \
+        + REPLY_OVERHEAD_TOKENS
+
+
+def prompt_budget(model, completion_tokens=COMPLETION_RESERVE):
+    """
+    Number of prompt tokens a request to the model may use.
+    """
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - completion_tokens
+
+
+def fits(messages, model, completion_tokens=COMPLETION_RESERVE):
+    return count_message_tokens(messages, model) <= prompt_budget(model, completion_tokens)
+
+
+def pack_chunks(sizes, budget):
+    """
+    Greedily packs items, given as {name: token count} in their original order, into consecutive
+    chunks whose total stays within the budget. An item larger than the budget gets a chunk of its
+    own. Returns a list of lists of names.
+    """
+    chunks = []
+    current = []
+    used = 0
+    for name, size in sizes.items():
+        if current and used + size > budget:
+            chunks.append(current)
+            current = []
+            used = 0
+        current.append(name)
+        used += size
+    if current:
+        chunks.append(current)
+    return chunks
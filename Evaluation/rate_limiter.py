@@ -0,0 +1,216 @@
+import asyncio
+import random
+import re
+import threading
+import time
+
+# Exponential backoff: the n-th retry waits a random time in [0, min(BACKOFF_CAP, BACKOFF_BASE * 2**n)]
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+# Adaptive concurrency: halve on a 429 or when a budget is nearly spent, add one after
+# INCREASE_AFTER consecutive healthy responses
+LOW_BUDGET_FRACTION = 0.1
+INCREASE_AFTER = 10
+
+# Polling interval while waiting for a concurrency slot
+POLL_INTERVAL = 0.05
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Delay before retry number `attempt` (0-based): the server's retry-after when given, otherwise
+    exponential backoff with full jitter.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def parse_duration(value):
+    """
+    Parses the durations used by the rate-limit headers ("1s", "6m0s", "120ms", "0.5") into seconds.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r'([\d.]+)(ms|s|m|h)', value):
+        matched = True
+        total += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return total if matched else None
+
+
+def retry_after_seconds(headers):
+    if headers is None:
+        return None
+    retry_after_ms = headers.get('retry-after-ms')
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get('retry-after'))
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at capacity per minute.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def reserve(self, amount):
+        """
+        Takes `amount` from the bucket and returns 0, or returns the seconds to wait before it can.
+        Requests larger than the bucket are clamped to its capacity so that they can still run.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            self.level -= amount
+            return 0.0
+        return (amount - self.level) * 60.0 / self.capacity
+
+    def set_capacity(self, per_minute):
+        self._refill()
+        self.capacity = float(per_minute)
+        self.level = min(self.level, self.capacity)
+
+    def drain_to(self, remaining):
+        self._refill()
+        self.level = min(self.level, float(remaining))
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for one model, plus an adaptive cap on the
+    number of requests in flight. Usable from threads (acquire) and from asyncio (acquire_async).
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrency=16, min_concurrency=1):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.healthy_streak = 0
+        # Nothing is sent before this monotonic time (set after a 429)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, estimated_tokens):
+        """
+        Returns 0 once a slot and both budgets have been taken, otherwise the seconds to wait.
+        """
+        with self._lock:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                return pause
+            if self.in_flight >= self.concurrency:
+                return POLL_INTERVAL
+            request_wait = self.requests.reserve(1)
+            if request_wait > 0:
+                return request_wait
+            token_wait = self.tokens.reserve(estimated_tokens)
+            if token_wait > 0:
+                # Give the request budget back; we try again after the wait
+                self.requests.level += 1
+                return token_wait
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, estimated_tokens):
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, estimated_tokens):
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, estimated_tokens=0, used_tokens=None):
+        """
+        Frees the concurrency slot. When the actual token usage is known, the difference with the
+        estimate is settled against the token budget.
+        """
+        with self._lock:
+            self.in_flight = max(self.in_flight - 1, 0)
+            if used_tokens is not None:
+                self.tokens.level = min(self.tokens.capacity, self.tokens.level + estimated_tokens - used_tokens)
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        Called on a 429: halves the concurrency and pauses every caller until retry-after.
+        """
+        with self._lock:
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            self.healthy_streak = 0
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def update_from_headers(self, headers):
+        """
+        Adapts budgets and concurrency from the x-ratelimit-* response headers.
+        """
+        if headers is None:
+            return
+        with self._lock:
+            limit_requests = _int_header(headers, 'x-ratelimit-limit-requests')
+            limit_tokens = _int_header(headers, 'x-ratelimit-limit-tokens')
+            remaining_requests = _int_header(headers, 'x-ratelimit-remaining-requests')
+            remaining_tokens = _int_header(headers, 'x-ratelimit-remaining-tokens')
+
+            if limit_requests:
+                self.requests.set_capacity(limit_requests)
+            if limit_tokens:
+                self.tokens.set_capacity(limit_tokens)
+            # The server's view of the budget wins over our local estimate
+            if remaining_requests is not None:
+                self.requests.drain_to(remaining_requests)
+            if remaining_tokens is not None:
+                self.tokens.drain_to(remaining_tokens)
+
+            low = (
+                (limit_requests and remaining_requests is not None
+                 and remaining_requests < LOW_BUDGET_FRACTION * limit_requests)
+                or (limit_tokens and remaining_tokens is not None
+                    and remaining_tokens < LOW_BUDGET_FRACTION * limit_tokens)
+            )
+            if low:
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self.healthy_streak = 0
+            else:
+                self.healthy_streak += 1
+                if self.healthy_streak >= INCREASE_AFTER and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self.healthy_streak = 0
+
+
+def _int_header(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
@@ -0,0 +1,124 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# JSONL run log shared by every script pool; one line per executed script
+RUN_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solve_runs.jsonl')
+
+# Number of slowest solves listed by the summary
+SLOWEST_SOLVES = 20
+
+PROBLEM_TYPE_PATTERN = re.compile(r'#\s*Problem type:\s*(LP|MIP)')
+
+_write_lock = threading.Lock()
+
+
+def script_identity(script_path):
+    """
+    Returns (problem id, suffix) of a script: optimus-code_e.py in <problem>/ is ('<problem>', 'e'),
+    optimus-code.py in <problem>/<problem>_c/ is ('<problem>', 'c').
+    """
+    directory = os.path.basename(os.path.dirname(os.path.abspath(script_path)))
+    stem = os.path.splitext(os.path.basename(script_path))[0]
+    if '_' in stem:
+        return directory, stem.rsplit('_', 1)[1]
+    if '_' in directory:
+        problem_id, suffix = directory.rsplit('_', 1)
+        return problem_id, suffix
+    return directory, None
+
+
+def problem_type(script_path, stats=None):
+    """
+    'LP' or 'MIP': from the solved model when there is one, else from the "# Problem type:" header of
+    the script. None when neither tells.
+    """
+    if stats and stats.get('is_mip') is not None:
+        return 'MIP' if stats['is_mip'] else 'LP'
+    try:
+        with open(script_path, 'r') as f:
+            header = f.read(2000)
+    except OSError:
+        return None
+    match = PROBLEM_TYPE_PATTERN.search(header)
+    return match.group(1) if match else None
+
+
+def record_run(result, path=RUN_LOG_PATH):
+    """
+    Appends the record of one executed script (a ScriptResult) to the run log.
+    """
+    problem_id, suffix = script_identity(result.path)
+    stats = result.stats or {}
+    record = {
+        'time': time.time(),
+        'script': os.path.abspath(result.path),
+        'problem': problem_id,
+        'suffix': suffix,
+        'problem_type': problem_type(result.path, stats),
+        'outcome': result.outcome,
+        'returncode': result.returncode,
+        'wall_seconds': result.seconds,
+        'threads': result.threads,
+        'peak_rss': result.peak_rss,
+    }
+    record.update({key: value for key, value in stats.items() if key != 'is_mip'})
+    if not result.ok:
+        # Last line of the traceback (or the timeout / worker exit message) for triage
+        lines = [line for line in result.stderr.splitlines() if line.strip()]
+        record['error'] = lines[-1][:500] if lines else None
+    line = json.dumps(record)
+    with _write_lock:
+        with open(path, 'a') as f:
+            f.write(line + '\n')
+
+
+def load_runs(path=RUN_LOG_PATH):
+    runs = []
+    if not os.path.isfile(path):
+        return runs
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                runs.append(json.loads(line))
+    return runs
+
+
+def _cell(value, width, digits=None):
+    # Missing values (timeouts, crashes, LPs without a gap) are shown as '-'
+    if not isinstance(value, (int, float)):
+        return f"{'-':>{width}}"
+    return f"{value:>{width}.{digits}f}" if digits is not None else f"{value:>{width}}"
+
+
+def summarize(path=RUN_LOG_PATH):
+    runs = load_runs(path)
+    if not runs:
+        print(f"No solve runs found in {path}")
+        return
+
+    outcomes = {}
+    for run in runs:
+        outcomes[run.get('outcome')] = outcomes.get(run.get('outcome'), 0) + 1
+    print(f"{len(runs)} runs: " + ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())))
+
+    slowest = sorted(runs, key=lambda run: run.get('wall_seconds') or 0, reverse=True)[:SLOWEST_SOLVES]
+    print(f"\n=== {len(slowest)} slowest solves ===")
+    print(f"{'problem':>12} | {'suffix':>6} | {'type':>4} | {'outcome':>7} | {'wall (s)':>9} | {'runtime':>9} | "
+          f"{'nodes':>9} | {'gap':>8} | {'rows':>8} | {'cols':>8} | {'nnz':>9} | {'RSS (MB)':>8}")
+    for run in slowest:
+        peak_rss = run['peak_rss'] / 2 ** 20 if run.get('peak_rss') else None
+        print(f"{str(run.get('problem')):>12} | {str(run.get('suffix')):>6} | {str(run.get('problem_type')):>4} | "
+              f"{str(run.get('outcome')):>7} | {_cell(run.get('wall_seconds'), 9, 2)} | "
+              f"{_cell(run.get('runtime'), 9, 2)} | {_cell(run.get('node_count'), 9, 0)} | "
+              f"{_cell(run.get('mip_gap'), 8, 4)} | {_cell(run.get('rows'), 8)} | "
+              f"{_cell(run.get('cols'), 8)} | {_cell(run.get('nnz'), 9)} | {_cell(peak_rss, 8, 1)}")
+
+
+if __name__ == "__main__":
+    # Usage: python run_log.py [solve_runs.jsonl]
+    summarize(sys.argv[1] if len(sys.argv) > 1 else RUN_LOG_PATH)
@@ -0,0 +1,471 @@
+import collections
+import gc
+import io
+import multiprocessing
+import os
+import queue
+import runpy
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+
+from run_log import record_run
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds a script may run before its worker is killed (and replaced by a fresh one)
+DEFAULT_TIMEOUT = 600
+# Modules every worker imports once, before its first script: the solver import and license check
+# are paid once per worker instead of once per script
+PRELOAD_MODULES = ('gurobipy',)
+
+# Solver threads by model size (bytes of the model.lp next to the script, or of parameters.json when
+# there is none): tiny models are solved single-threaded, many at a time; larger ones get several
+# threads, fewer at a time
+THREADS_BY_MODEL_SIZE = [(1_000_000, 1), (20_000_000, 4)]
+LARGE_MODEL_THREADS = 8
+# Thread policies: 'size' (THREADS_BY_MODEL_SIZE), 'single' (one thread per solve) or 'all' (the solver
+# default, every solve uses every core; kept for comparison)
+THREAD_POLICIES = ('size', 'single', 'all')
+
+
+# Gurobi status codes of a solve stopped by its TimeLimit / MemLimit
+TIME_LIMIT_STATUS = 9
+MEM_LIMIT_STATUS = 17
+# Gurobi error code for running out of memory
+OUT_OF_MEMORY_ERROR = 10001
+
+# Gurobi attributes recorded for the model solved by a script (None when the model has no value for one,
+# e.g. MIPGap of an LP)
+SOLVER_ATTRIBUTES = {
+    'runtime': 'Runtime',
+    'status': 'Status',
+    'node_count': 'NodeCount',
+    'iter_count': 'IterCount',
+    'mip_gap': 'MIPGap',
+    'rows': 'NumConstrs',
+    'cols': 'NumVars',
+    'nnz': 'NumNZs',
+    'is_mip': 'IsMIP',
+}
+
+
+class SolveLimits:
+    """
+    Hard limits of every solve of a pool; None leaves a limit off.
+    time_limit (seconds) and mem_limit (GB) are set as the Gurobi TimeLimit / MemLimit of the models
+    the script creates. address_space (GB) and cpu_seconds are OS limits (RLIMIT_AS / RLIMIT_CPU) of the
+    worker while it runs the script: allocations beyond the address space fail with MemoryError, and
+    a worker over its CPU time (all solver threads count) is killed and replaced. Neither OS limit is
+    available on Windows, and macOS does not enforce RLIMIT_AS.
+    """
+
+    def __init__(self, time_limit=None, mem_limit=None, address_space=None, cpu_seconds=None):
+        self.time_limit = time_limit
+        self.mem_limit = mem_limit
+        self.address_space = address_space
+        self.cpu_seconds = cpu_seconds
+
+    def as_dict(self):
+        return {
+            'time_limit': self.time_limit,
+            'mem_limit': self.mem_limit,
+            'address_space': self.address_space,
+            'cpu_seconds': self.cpu_seconds,
+        }
+
+
+class ScriptResult:
+    """
+    Outcome of one script: exit code (None when it timed out or its worker died), captured
+    stdout/stderr, the wall time, the statistics of the solved model and the peak RSS of the solve.
+    """
+
+    def __init__(self, path, returncode, stdout, stderr, seconds, timed_out=False, stats=None,
+                 peak_rss=None, threads=None, out_of_memory=False, exitcode=None):
+        self.path = path
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+        self.timed_out = timed_out
+        self.stats = stats
+        self.peak_rss = peak_rss
+        self.threads = threads
+        self.out_of_memory = out_of_memory
+        # Exit code of the worker when it died in the middle of the script (negative: killed by a signal)
+        self.exitcode = exitcode
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def outcome(self):
+        """
+        'ok', 'timeout' (wall clock, CPU time or Gurobi TimeLimit), 'oom' (address space, Gurobi MemLimit
+        or killed by the OS), 'crash' (the worker died) or 'error' (the script failed).
+        """
+        status = self.stats.get('status') if self.stats else None
+        if self.timed_out or self.exitcode == -getattr(signal, 'SIGXCPU', 0) or status == TIME_LIMIT_STATUS:
+            return 'timeout'
+        # The Linux OOM killer sends SIGKILL
+        if self.out_of_memory or self.exitcode == -getattr(signal, 'SIGKILL', 0) or status == MEM_LIMIT_STATUS:
+            return 'oom'
+        if self.returncode is None:
+            return 'crash'
+        return 'ok' if self.ok else 'error'
+
+
+def _exit_code(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _model_attribute(model, name):
+    try:
+        return getattr(model, name)
+    except Exception:
+        return None
+
+
+def solver_stats(namespace):
+    """
+    Statistics (SOLVER_ATTRIBUTES) of the gurobipy model left in the globals of a script: the one
+    named `model`, or the first one found. None when the script built no model.
+    """
+    gurobipy = sys.modules.get('gurobipy')
+    if gurobipy is None:
+        return None
+    models = [value for value in namespace.values() if isinstance(value, gurobipy.Model)]
+    if not models:
+        return None
+    model = namespace.get('model') if isinstance(namespace.get('model'), gurobipy.Model) else models[0]
+    return {key: _model_attribute(model, name) for key, name in SOLVER_ATTRIBUTES.items()}
+
+
+def _reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets the high-water mark (VmHWM) of the process, so the
+    # peak read after a script is the one of that script, not of the worker's lifetime
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    # Peak resident set size of the process in bytes
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _is_out_of_memory(error):
+    return isinstance(error, MemoryError) or getattr(error, 'errno', None) == OUT_OF_MEMORY_ERROR
+
+
+def run_script(path):
+    """
+    Runs a script in the current process the way `python path` would (as __main__, with its directory
+    first on sys.path), in a fresh globals dict. Returns (exit code, stdout, stderr, solver stats,
+    peak RSS in bytes, whether it ran out of memory).
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    sys.argv = [path]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    code = 0
+    stats = None
+    out_of_memory = False
+    _reset_peak_rss()
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                stats = solver_stats(runpy.run_path(path, run_name='__main__'))
+            except SystemExit as e:
+                code = _exit_code(e.code)
+            except BaseException as e:
+                out_of_memory = _is_out_of_memory(e)
+                traceback.print_exc()
+                code = 1
+        peak_rss = _peak_rss()
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        # Free the models of the script before the next one starts
+        gc.collect()
+    return code, stdout.getvalue(), stderr.getvalue(), stats, peak_rss, out_of_memory
+
+
+def model_size(script_path):
+    """
+    Size in bytes of the model solved by a script: its model.lp, or its parameters.json.
+    """
+    directory = os.path.dirname(os.path.abspath(script_path))
+    for file_name in ('model.lp', 'parameters.json'):
+        path = os.path.join(directory, file_name)
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+    return 0
+
+
+def solver_threads(script_path, cores, policy='size'):
+    """
+    Threads parameter for the solve of a script under the policy; None leaves the solver default.
+    """
+    if policy == 'all':
+        return None
+    if policy == 'single':
+        return 1
+    size = model_size(script_path)
+    for limit, threads in THREADS_BY_MODEL_SIZE:
+        if size < limit:
+            return min(threads, cores)
+    return min(LARGE_MODEL_THREADS, cores)
+
+
+def _set_solver_params(threads, limits):
+    gurobipy = sys.modules.get('gurobipy')
+    if gurobipy is None:
+        return
+    # Models created by the next script inherit the parameters of the default environment;
+    # the reset drops the Threads and limits of the previous script
+    with redirect_stdout(io.StringIO()):
+        gurobipy.resetParams()
+        if threads:
+            gurobipy.setParam('Threads', threads)
+        if limits and limits.time_limit is not None:
+            gurobipy.setParam('TimeLimit', limits.time_limit)
+        if limits and limits.mem_limit is not None:
+            gurobipy.setParam('MemLimit', limits.mem_limit)
+
+
+def _set_os_limits(limits, initial):
+    """
+    Sets the RLIMIT_AS / RLIMIT_CPU soft limits of the worker for the next script; limits None restores
+    the initial ones. Only the soft limits are changed, so they can be raised again afterwards.
+    """
+    if resource is None:
+        return
+    address_space = limits.address_space if limits else None
+    cpu_seconds = limits.cpu_seconds if limits else None
+    soft, hard = initial[resource.RLIMIT_AS]
+    if address_space is not None:
+        soft = int(address_space * 2 ** 30)
+    _set_soft_limit(resource.RLIMIT_AS, soft, hard)
+    soft, hard = initial[resource.RLIMIT_CPU]
+    if cpu_seconds is not None:
+        # RLIMIT_CPU counts the CPU time of the whole worker, so the budget starts from what it used so far
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+    _set_soft_limit(resource.RLIMIT_CPU, soft, hard)
+
+
+def _set_soft_limit(kind, soft, hard):
+    if hard != resource.RLIM_INFINITY and (soft == resource.RLIM_INFINITY or soft > hard):
+        soft = hard
+    try:
+        resource.setrlimit(kind, (soft, hard))
+    except (ValueError, OSError):
+        pass
+
+
+class CoreBudget:
+    """
+    Cores shared by the solves of a pool: a solve starts once its threads are free. Solves start in
+    the order they asked (FIFO tickets): a multi-threaded solve at the head of the queue is not
+    overtaken by later single-threaded ones, so it cannot starve and the dispatch order is kept.
+    """
+
+    def __init__(self, cores):
+        self.cores = cores
+        self.free = cores
+        self._condition = threading.Condition()
+        self._waiting = collections.deque()
+
+    def acquire(self, threads):
+        # A solve asking for more than the machine has still runs, alone
+        threads = min(threads, self.cores)
+        ticket = object()
+        with self._condition:
+            self._waiting.append(ticket)
+            self._condition.wait_for(lambda: self._waiting[0] is ticket and self.free >= threads)
+            self._waiting.popleft()
+            self.free -= threads
+            # The next ticket may fit in what is left
+            self._condition.notify_all()
+        return threads
+
+    def release(self, threads):
+        with self._condition:
+            self.free += threads
+            self._condition.notify_all()
+
+
+def _worker_main(connection, preload):
+    for module in preload:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    initial_limits = {}
+    if resource is not None:
+        for kind in (resource.RLIMIT_AS, resource.RLIMIT_CPU):
+            initial_limits[kind] = resource.getrlimit(kind)
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        path, threads, limits = task
+        _set_solver_params(threads, limits)
+        _set_os_limits(limits, initial_limits)
+        try:
+            output = run_script(path)
+        finally:
+            # The pipe and the next task need the worker's memory back
+            _set_os_limits(None, initial_limits)
+        connection.send(output)
+
+
+class _Worker:
+    def __init__(self, preload):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child, preload), daemon=True)
+        self.process.start()
+        child.close()
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def run(self, path, timeout, threads=None, limits=None):
+        start = time.perf_counter()
+        self.connection.send((path, threads, limits))
+        if not self.connection.poll(timeout):
+            self.kill()
+            return ScriptResult(path, None, '', f"Timed out after {timeout}s", time.perf_counter() - start, True,
+                                threads=threads)
+        try:
+            code, stdout, stderr, stats, peak_rss, out_of_memory = self.connection.recv()
+        except EOFError:
+            # The worker died in the middle of the script (segfault, over its CPU time, killed by the OS, ...)
+            self.process.join()
+            return ScriptResult(path, None, '', f"Worker exited with code {self.process.exitcode}",
+                                time.perf_counter() - start, threads=threads, exitcode=self.process.exitcode)
+        return ScriptResult(path, code, stdout, stderr, time.perf_counter() - start, stats=stats,
+                            peak_rss=peak_rss, threads=threads, out_of_memory=out_of_memory)
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+    def close(self):
+        if self.alive:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(5)
+        if self.alive:
+            self.kill()
+
+
+class ScriptPool:
+    """
+    Persistent worker processes that execute optimus-code.py (and similar) scripts in-process, each
+    with isolated globals, a per-task timeout and captured output. A worker that times out or dies is
+    replaced, so one bad script never stalls the pool.
+
+    With a core budget (cores), every solve is charged its Threads (one when it uses the solver
+    default) and only starts while the budget has room, so parallel solves with an explicit
+    Threads never oversubscribe the machine.
+
+    With a run log (a JSONL path, see run_log.py), a record of every execution is appended to it.
+
+    With limits (SolveLimits), every solve also runs under the Gurobi TimeLimit / MemLimit and the OS
+    address space / CPU time limits they set.
+    """
+
+    def __init__(self, workers=1, timeout=DEFAULT_TIMEOUT, preload=PRELOAD_MODULES, cores=None, run_log=None,
+                 limits=None):
+        self.timeout = timeout
+        self.preload = preload
+        self.budget = CoreBudget(cores) if cores else None
+        self.run_log = run_log
+        self.limits = limits
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(_Worker(preload))
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _run(self, path, timeout, threads):
+        charged = self.budget.acquire(threads or 1) if self.budget else 0
+        worker = self._idle.get()
+        try:
+            result = worker.run(path, self.timeout if timeout is None else timeout, threads, self.limits)
+            if self.run_log:
+                record_run(result, self.run_log)
+            return result
+        finally:
+            if not worker.alive:
+                worker = _Worker(self.preload)
+            self._idle.put(worker)
+            if self.budget:
+                self.budget.release(charged)
+
+    def submit(self, path, timeout=None, threads=None):
+        return self._executor.submit(self._run, path, timeout, threads)
+
+    def run(self, path, timeout=None, threads=None):
+        return self.submit(path, timeout, threads).result()
+
+    def map(self, paths, timeout=None, policy=None):
+        """
+        Runs every script and yields the results in the order of the paths. With a thread policy,
+        the Threads of every solve is set from it and the core budget of the pool.
+        """
+        cores = self.budget.cores if self.budget else (os.cpu_count() or 1)
+        futures = [
+            self.submit(path, timeout, solver_threads(path, cores, policy) if policy else None)
+            for path in paths
+        ]
+        for future in futures:
+            yield future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while not self._idle.empty():
+            self._idle.get().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
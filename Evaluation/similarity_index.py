@@ -0,0 +1,103 @@
+import re
+
+import numpy as np
+
+# Words and numbers; camelCase and snake_case identifiers are split into their parts first
+WORD_PATTERN = re.compile(r'[a-z]+|\d+')
+CAMEL_CASE_PATTERN = re.compile(r'([a-z])([A-Z])')
+
+
+def tokenize(text):
+    text = CAMEL_CASE_PATTERN.sub(r'\1 \2', text or '').replace('_', ' ')
+    return WORD_PATTERN.findall(text.lower())
+
+
+def variable_document(var_name, var_info, incidence):
+    """
+    Tokens describing a variable: its name, its description, and the descriptions of the constraints
+    (and objective) it appears in, taken from the incidence index of its problem.
+    """
+    parts = [var_name, var_info.get('description', '') if isinstance(var_info, dict) else '']
+    for constraint in incidence.constraints_involving(var_name):
+        parts.append(constraint.get('description', ''))
+    if incidence.in_objective(var_name):
+        objective = incidence.objective
+        parts.append('objective ' + str(objective.get('description', '') if isinstance(objective, dict) else objective))
+    return tokenize(' '.join(parts))
+
+
+class TfidfIndex:
+    """
+    TF-IDF vectors (sublinear term frequency, smoothed IDF, L2-normalised) of a set of documents,
+    queried by cosine similarity. Built with NumPy only, no network or model download.
+    """
+
+    def __init__(self, documents):
+        self.names = list(documents)
+        vocabulary = {}
+        for tokens in documents.values():
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+        self.vocabulary = vocabulary
+
+        counts = np.zeros((len(self.names), len(vocabulary)))
+        for row, name in enumerate(self.names):
+            for token in documents[name]:
+                counts[row, vocabulary[token]] += 1
+        document_frequency = (counts > 0).sum(axis=0)
+        self.idf = np.log((1 + len(self.names)) / (1 + document_frequency)) + 1
+        self.matrix = self._normalise(self._weigh(counts))
+
+    def _weigh(self, counts):
+        weighted = np.zeros_like(counts)
+        nonzero = counts > 0
+        weighted[nonzero] = 1 + np.log(counts[nonzero])
+        return weighted * self.idf
+
+    @staticmethod
+    def _normalise(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def vector(self, tokens):
+        counts = np.zeros(len(self.vocabulary))
+        for token in tokens:
+            position = self.vocabulary.get(token)
+            if position is not None:
+                counts[position] += 1
+        return self._normalise(self._weigh(counts))
+
+    def top_k(self, tokens, k):
+        """
+        Names of the k most similar documents, best first.
+        """
+        scores = self.matrix @ self.vector(tokens)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return [self.names[i] for i in order]
+
+
+def shortlist_candidates(variables1, index1, variables2, index2, k, min_variables):
+    """
+    Returns {Problem 1 variable: [its k most similar Problem 2 variables]}, or None when Problem 2 has
+    at most min_variables variables (the full list is short enough to send as is).
+    """
+    if len(variables2) <= max(min_variables, k):
+        return None
+    index = TfidfIndex({name: variable_document(name, info, index2) for name, info in variables2.items()})
+    return {
+        name: index.top_k(variable_document(name, info, index1), k)
+        for name, info in variables1.items()
+    }
+
+
+def shortlist_union(shortlist, variable_names):
+    """
+    Union of the shortlists of several Problem 1 variables, in a stable order.
+    """
+    union = []
+    for name in variable_names:
+        for candidate in shortlist.get(name, []):
+            if candidate not in union:
+                union.append(candidate)
+    return union
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+# Sidecar written next to every solution file (solution.json -> solution.meta.json) with the hashes
+# of the inputs it was solved from
+MANIFEST_SUFFIX = '.meta.json'
+
+# The scripts load their data and save their solution through hard-coded paths
+PARAMETERS_PATTERN = re.compile(r'open\(\s*["\']([^"\']*parameters\.json)["\']')
+SOLUTION_PATTERN = re.compile(r'open\(\s*["\']([^"\']*solution[^"\'/]*\.json)["\']\s*,\s*["\']w')
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _referenced_path(script_text, pattern, script_dir, default_name):
+    match = pattern.search(script_text)
+    if match:
+        path = match.group(1)
+        return path if os.path.isabs(path) else os.path.join(script_dir, path)
+    return os.path.join(script_dir, default_name)
+
+
+def script_files(script_path):
+    """
+    Returns (parameters path, solution path) of a script: the paths it opens, or the files of the same
+    name next to it.
+    """
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    with open(script_path, 'r') as f:
+        text = f.read()
+    parameters = _referenced_path(text, PARAMETERS_PATTERN, script_dir, 'parameters.json')
+    solution = _referenced_path(text, SOLUTION_PATTERN, script_dir, 'solution.json')
+    return parameters, solution
+
+
+def manifest_path(solution_path):
+    # solution.json -> solution.meta.json, solution_e.json -> solution_e.meta.json
+    return os.path.splitext(solution_path)[0] + MANIFEST_SUFFIX
+
+
+def input_manifest(script_path, settings):
+    """
+    Content hashes of everything a solve depends on: the script, its parameters and the solver settings.
+    """
+    parameters, _ = script_files(script_path)
+    inputs = {
+        'script': file_hash(script_path),
+        'parameters': file_hash(parameters) if os.path.isfile(parameters) else None,
+        'settings': hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest(),
+    }
+    digest = hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+    return digest, inputs
+
+
+def is_current(script_path, settings):
+    """
+    Whether the solution of the script exists and was solved from the current inputs.
+    """
+    _, solution = script_files(script_path)
+    if not os.path.isfile(solution):
+        return False
+    try:
+        with open(manifest_path(solution), 'r') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return manifest.get('input_hash') == input_manifest(script_path, settings)[0]
+
+
+def record_solve(script_path, settings, started):
+    """
+    Writes the manifest of a successful solve next to its solution, if the solve (started at the
+    time.time() `started`) wrote the solution. A script that exited without writing it leaves an older
+    solution behind: its manifest is removed instead, so the script is solved again next time.
+    Returns whether the manifest was written.
+    """
+    _, solution = script_files(script_path)
+    path = manifest_path(solution)
+    # Whole seconds: some file systems store mtimes with a one-second resolution
+    if not os.path.isfile(solution) or os.path.getmtime(solution) < int(started):
+        if os.path.isfile(path):
+            os.remove(path)
+        return False
+    digest, inputs = input_manifest(script_path, settings)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'input_hash': digest,
+            'inputs': inputs,
+            'settings': settings,
+            'script': os.path.abspath(script_path),
+            'solved_at': time.time()
+        }, f, indent=4)
+    os.replace(tmp_path, path)
+    return True
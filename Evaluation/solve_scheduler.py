@@ -0,0 +1,89 @@
+import heapq
+import os
+import statistics
+
+from script_pool import model_size
+
+# Seconds per MB of model (model.lp, or parameters.json) assumed for scripts without history when no
+# history is available to calibrate it
+DEFAULT_SECONDS_PER_MB = 2.0
+# Smallest prediction, so tiny models without history still count for the worker they occupy
+MIN_PREDICTED_SECONDS = 0.1
+
+
+# Outcomes whose wall time says how long a script takes: completed solves, and timeouts (capped at the
+# timeout, still long). Errors and crashes end early and say nothing about the solve.
+HISTORY_OUTCOMES = ('ok', 'timeout')
+
+
+def runtime_history(runs):
+    """
+    Returns ({script: wall seconds of its latest completed or timed-out run}, set of the scripts that
+    timed out there).
+    """
+    history = {}
+    timed_out = set()
+    for run in runs:
+        if run.get('script') and run.get('wall_seconds') is not None and run.get('outcome') in HISTORY_OUTCOMES:
+            history[run['script']] = run['wall_seconds']
+            if run['outcome'] == 'timeout':
+                timed_out.add(run['script'])
+            else:
+                timed_out.discard(run['script'])
+    return history, timed_out
+
+
+def seconds_per_mb(history, timed_out=()):
+    """
+    Median seconds per MB of model over the scripts with a completed run, DEFAULT_SECONDS_PER_MB without.
+    """
+    rates = []
+    for script, seconds in history.items():
+        if script not in timed_out and os.path.isfile(script):
+            size = model_size(script)
+            if size:
+                rates.append(seconds / (size / 2 ** 20))
+    return statistics.median(rates) if rates else DEFAULT_SECONDS_PER_MB
+
+
+def predict_seconds(script_paths, runs):
+    """
+    Predicted wall seconds of every script: its last completed (or timed-out) run, else its model size
+    times the rate observed on the other scripts.
+    """
+    history, timed_out = runtime_history(runs)
+    rate = seconds_per_mb(history, timed_out)
+    predicted = {}
+    for path in script_paths:
+        seconds = history.get(os.path.abspath(path))
+        if seconds is None:
+            seconds = model_size(path) / 2 ** 20 * rate
+        predicted[path] = max(seconds, MIN_PREDICTED_SECONDS)
+    return predicted
+
+
+def longest_first(script_paths, predicted):
+    # Longest-processing-time-first: the slow solves start first instead of stretching the tail
+    return sorted(script_paths, key=lambda path: predicted[path], reverse=True)
+
+
+def makespan(script_paths, predicted, workers, cores=None, threads=None):
+    """
+    Predicted makespan of dispatching the scripts in order to a ScriptPool with `workers` workers and a
+    core budget of `cores`: a script starts, in order, once a worker and its threads are free.
+    """
+    cores = cores or workers
+    threads = threads or {}
+    running = []  # heap of (end time, threads charged)
+    busy_cores = 0
+    now = 0.0
+    end = 0.0
+    for path in script_paths:
+        charged = min(threads.get(path) or 1, cores)
+        while running and (len(running) >= workers or busy_cores + charged > cores):
+            now, released = heapq.heappop(running)
+            busy_cores -= released
+        heapq.heappush(running, (now + predicted[path], charged))
+        busy_cores += charged
+        end = max(end, now + predicted[path])
+    return end
@@ -1,29 +1,80 @@
 import os
-import subprocess
 import glob
+import time
+
+from run_log import RUN_LOG_PATH, load_runs
+from script_pool import ScriptPool, SolveLimits, solver_threads
+from solve_manifest import is_current, record_solve
+from solve_scheduler import longest_first, makespan, predict_seconds
 
 # Base directory where your data is stored
 base_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy'
 
-# Create a pattern to match directories ending with '_2'
-pattern = os.path.join(base_dir, '*', '*_i*', 'optimus-code.py')
-
-# Find all matching 'optimus-code.py' files
-script_paths = glob.glob(pattern)
-
-# Iterate over each script and execute it
-for script_path in script_paths:
-    try:
-        result = subprocess.run(
-            ['python', script_path],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print(f"Script {script_path} executed successfully.")
-        print("Standard Output:")
-        print(result.stdout)
-    except subprocess.CalledProcessError as e:
-        print(f"An error occurred while executing the script {script_path}.")
-        print("Standard Error:")
-        print(e.stderr)
+# Cores shared by the parallel solves; one worker process per core, each one imports gurobipy once
+CORES = os.cpu_count() or 1
+# Solver threads per model: 'size' (by model size, see script_pool.py), 'single' or 'all' (Gurobi default)
+THREAD_POLICY = 'size'
+# Seconds a script may run before its worker is stopped
+SCRIPT_TIMEOUT = 600
+# Hard limits of every solve: Gurobi TimeLimit (s) / MemLimit (GB), OS address space (GB) / CPU seconds;
+# the TimeLimit stops the solver before the wall-clock timeout kills its worker
+SOLVE_LIMITS = SolveLimits(time_limit=SCRIPT_TIMEOUT - 60, mem_limit=None, address_space=None, cpu_seconds=None)
+# Re-solve every script, even when its solution was solved from the current inputs
+FORCE = False
+
+
+def main():
+    # Create a pattern to match directories ending with '_2'
+    pattern = os.path.join(base_dir, '*', '*_i*', 'optimus-code.py')
+
+    # Find all matching 'optimus-code.py' files
+    script_paths = glob.glob(pattern)
+
+    # Skip the scripts whose solution was solved from the same script, parameters and solver settings
+    settings = {
+        path: {'threads': solver_threads(path, CORES, THREAD_POLICY), 'limits': SOLVE_LIMITS.as_dict()}
+        for path in script_paths
+    }
+    stale_paths = [path for path in script_paths if FORCE or not is_current(path, settings[path])]
+    print(f"{len(script_paths)} scripts: {len(script_paths) - len(stale_paths)} reused, "
+          f"{len(stale_paths)} to solve")
+
+    # Dispatch the longest solves first, predicted from the run log (or from the model size)
+    predicted = predict_seconds(stale_paths, load_runs(RUN_LOG_PATH))
+    threads = {path: settings[path]['threads'] for path in stale_paths}
+    glob_makespan = makespan(stale_paths, predicted, CORES, CORES, threads)
+    stale_paths = longest_first(stale_paths, predicted)
+    predicted_makespan = makespan(stale_paths, predicted, CORES, CORES, threads)
+    print(f"Predicted makespan: {predicted_makespan:.1f}s longest first ({glob_makespan:.1f}s in glob order)")
+
+    # Execute each stale script in the worker pool
+    with ScriptPool(CORES, SCRIPT_TIMEOUT, cores=CORES, run_log=RUN_LOG_PATH, limits=SOLVE_LIMITS) as pool:
+        start = time.perf_counter()
+        # Only solutions written after this point were produced by this run
+        started = time.time()
+        outcomes = {}
+        for result in pool.map(stale_paths, policy=THREAD_POLICY):
+            outcomes[result.outcome] = outcomes.get(result.outcome, 0) + 1
+            if result.outcome == 'ok':
+                if not record_solve(result.path, settings[result.path], started):
+                    print(f"Script {result.path} did not write its solution; it is not cached.")
+                print(f"Script {result.path} executed successfully.")
+                print("Standard Output:")
+                print(result.stdout)
+            elif result.ok:
+                # The script exited normally, but its solve was stopped by the Gurobi TimeLimit / MemLimit;
+                # it is not reused by the next run
+                print(f"Script {result.path} hit a solver limit ({result.outcome}); its solution may not be optimal.")
+                print("Standard Output:")
+                print(result.stdout)
+            else:
+                print(f"An error occurred while executing the script {result.path} ({result.outcome}).")
+                print("Standard Error:")
+                print(result.stderr)
+        print("Outcomes: " + ", ".join(f"{count} {outcome}" for outcome, count in sorted(outcomes.items())))
+        print(f"Makespan: {time.perf_counter() - start:.1f}s (predicted {predicted_makespan:.1f}s)")
+
+
+# The guard keeps the workers (spawned on macOS/Windows) from re-running the sweep
+if __name__ == "__main__":
+    main()
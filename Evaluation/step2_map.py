@@ -4,6 +4,10 @@ import json
 # Base directory
 base_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy/'
 
+# Mapping file read from each variant directory: 'variable_mappings.json' (found by mapping_finder_.py)
+# or 'mapping.json' (ground truth written by the generators in utils/)
+MAPPINGS_FILE = 'variable_mappings.json'
+
 # Walk through the base directory
 for root, dirs, files in os.walk(base_dir):
     # Skip subdirectories beyond the immediate children of base_dir
@@ -15,11 +19,11 @@ for root, dirs, files in os.walk(base_dir):
             dir_path = os.path.join(root, dir_name)
             
             # Define the paths to the necessary files within this directory
-            variable_mappings_path = os.path.join(dir_path, 'variable_mappings.json')
+            variable_mappings_path = os.path.join(dir_path, MAPPINGS_FILE)
             solution_path = os.path.join(dir_path, 'solution.json')
             output_path = os.path.join(dir_path, 'map_constraints.py')
             
-            # Check if variable_mappings.json and solution.json exist
+            # Check if the mapping file and solution.json exist
             if os.path.exists(variable_mappings_path) and os.path.exists(solution_path):
                 # Read the variable mappings
                 with open(variable_mappings_path, 'r') as f:
@@ -97,4 +101,4 @@ for root, dirs, files in os.walk(base_dir):
                     
                     print(f"Processed directory: {dir_path}")
             else:
-                print(f"Skipped directory {dir_path} (missing variable_mappings.json or solution.json)")
+                print(f"Skipped directory {dir_path} (missing {MAPPINGS_FILE} or solution.json)")
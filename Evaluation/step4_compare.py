@@ -1,7 +1,16 @@
 import os
-import subprocess
 import json
 
+from run_log import RUN_LOG_PATH
+from script_pool import ScriptPool, SolveLimits
+
+# Seconds optimus-code_e.py may run before its worker is stopped
+SCRIPT_TIMEOUT = 600
+# Hard limits of every solve: Gurobi TimeLimit (s) / MemLimit (GB), OS address space (GB) / CPU seconds;
+# the TimeLimit stops the solver before the wall-clock timeout kills its worker.
+# A script over a limit is recorded as a runtime error (timeout / oom in the run log) and the sweep goes on.
+SOLVE_LIMITS = SolveLimits(time_limit=SCRIPT_TIMEOUT - 60, mem_limit=None, address_space=None, cpu_seconds=None)
+
 # ---------------------------------
 # 1. Helper function to detect LP/MIP from "optimus-code_e.py"
 # ---------------------------------
@@ -61,82 +70,80 @@ def main():
     # Tolerance for floating-point comparisons
     tolerance = 1e-6
 
-    # ---------------------------------
-    # 2a. Iterate over directories
-    # ---------------------------------
-    for dir_name in os.listdir(base_dir):
-        dir_path = os.path.join(base_dir, dir_name)
-        if not os.path.isdir(dir_path):
-            continue
-
-        # Figure out if it's LP or MIP by inspecting optimus-code_e.py
-        problem_type = get_problem_type_from_e(dir_path)
-        if problem_type not in ("LP", "MIP"):
-            # No recognized problem type => skip
-            print(f"Skipping '{dir_name}' (could not determine LP or MIP from optimus-code_e.py).")
-            continue
-
-        # Make sure optimus-code_e.py actually exists (our function already checked, but let's be safe)
-        optimus_code_e_path = os.path.join(dir_path, 'optimus-code_e.py')
-        if not os.path.exists(optimus_code_e_path):
-            print(f"optimus-code_e.py not found in {dir_path}")
-            continue
-
-        # Try running optimus-code_e.py
-        try:
-            result = subprocess.run(
-                ['python', optimus_code_e_path],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            print(f"Executed script in {dir_path} successfully.")
-            print("Standard Output:")
-            print(result.stdout)
-
-            # If script runs, we add to 'processed_dirs' for that problem type
-            results[problem_type]["processed_dirs"].append(dir_name)
-
-        except subprocess.CalledProcessError as e:
-            # This means a runtime error occurred (non-zero exit code)
-            print(f"An error occurred while executing the script in {dir_path}.")
-            print("Standard Error:")
-            print(e.stderr)
-            results[problem_type]["error_dirs"].append(dir_name)
-            runtime_errors += 1
-            # Skip the rest of the logic if there's a runtime error
-            continue
-
+    # One persistent worker runs every script, so gurobipy is imported once for the whole sweep
+    with ScriptPool(1, SCRIPT_TIMEOUT, run_log=RUN_LOG_PATH, limits=SOLVE_LIMITS) as pool:
         # ---------------------------------
-        # 2b. Compare solutions if both exist
+        # 2a. Iterate over directories
         # ---------------------------------
-        solution_path = os.path.join(dir_path, 'solution.json')
-        solution_e_path = os.path.join(dir_path, 'solution_e.json')
+        for dir_name in os.listdir(base_dir):
+            dir_path = os.path.join(base_dir, dir_name)
+            if not os.path.isdir(dir_path):
+                continue
 
-        if os.path.exists(solution_path) and os.path.exists(solution_e_path):
-            # We'll increment the total files count for the problem type
-            results[problem_type]["total_files"] += 1
+            # Figure out if it's LP or MIP by inspecting optimus-code_e.py
+            problem_type = get_problem_type_from_e(dir_path)
+            if problem_type not in ("LP", "MIP"):
+                # No recognized problem type => skip
+                print(f"Skipping '{dir_name}' (could not determine LP or MIP from optimus-code_e.py).")
+                continue
 
-            with open(solution_path, 'r') as f:
-                solution = json.load(f)
-                objective = solution.get('objective')
+            # Make sure optimus-code_e.py actually exists (our function already checked, but let's be safe)
+            optimus_code_e_path = os.path.join(dir_path, 'optimus-code_e.py')
+            if not os.path.exists(optimus_code_e_path):
+                print(f"optimus-code_e.py not found in {dir_path}")
+                continue
 
-            with open(solution_e_path, 'r') as f:
-                solution_e = json.load(f)
-                objective_e = solution_e.get('objective')
+            # Try running optimus-code_e.py
+            result = pool.run(optimus_code_e_path)
+            if result.outcome == 'ok':
+                print(f"Executed script in {dir_path} successfully.")
+                print("Standard Output:")
+                print(result.stdout)
 
-            # Check if 'objective' keys exist
-            if objective is None or objective_e is None:
-                print(f"Objective not found in one of the solution files in {dir_path}")
+                # If script runs, we add to 'processed_dirs' for that problem type
+                results[problem_type]["processed_dirs"].append(dir_name)
+
+            else:
+                # This means a runtime error occurred (non-zero exit code, timeout, crash, or a solve stopped
+                # by the Gurobi TimeLimit / MemLimit, whose incumbent objective is not comparable)
+                print(f"An error occurred while executing the script in {dir_path} ({result.outcome}).")
+                print("Standard Error:")
+                print(result.stderr)
+                results[problem_type]["error_dirs"].append(dir_name)
+                runtime_errors += 1
+                # Skip the rest of the logic if there's a runtime error
                 continue
 
-            # Compare
-            if abs(objective - objective_e) <= tolerance:
-                results[problem_type]["same_objectives"] += 1
+            # ---------------------------------
+            # 2b. Compare solutions if both exist
+            # ---------------------------------
+            solution_path = os.path.join(dir_path, 'solution.json')
+            solution_e_path = os.path.join(dir_path, 'solution_e.json')
+
+            if os.path.exists(solution_path) and os.path.exists(solution_e_path):
+                # We'll increment the total files count for the problem type
+                results[problem_type]["total_files"] += 1
+
+                with open(solution_path, 'r') as f:
+                    solution = json.load(f)
+                    objective = solution.get('objective')
+
+                with open(solution_e_path, 'r') as f:
+                    solution_e = json.load(f)
+                    objective_e = solution_e.get('objective')
+
+                # Check if 'objective' keys exist
+                if objective is None or objective_e is None:
+                    print(f"Objective not found in one of the solution files in {dir_path}")
+                    continue
+
+                # Compare
+                if abs(objective - objective_e) <= tolerance:
+                    results[problem_type]["same_objectives"] += 1
+                else:
+                    results[problem_type]["different_objectives"].append(dir_name)
             else:
-                results[problem_type]["different_objectives"].append(dir_name)
-        else:
-            print(f"One or both solution files are missing in {dir_path}")
+                print(f"One or both solution files are missing in {dir_path}")
 
     # ---------------------------------
     # 2c. Print Summary
@@ -0,0 +1,146 @@
+import os
+import re
+
+# LP file written next to each optimus-code.py by utils/lp_file_generation.py
+MODEL_LP_FILE = 'model.lp'
+
+# Version of the column signature; part of the mapping settings, so pairs prematched with an older
+# signature are mapped again
+SIGNATURE_VERSION = 2
+
+# Relative tolerance when comparing coefficients and scalars
+TOLERANCE = 1e-9
+
+# LP column names are "x", "x[3]" or "x[1,2]"
+ELEMENT_NAME_PATTERN = re.compile(r'^([^\[\]]+)(\[.*\])?$')
+
+
+def row_signature(model, constr):
+    """
+    Identifies a constraint independently of its name, position and the scaling of its columns:
+    (sense, right-hand side, number of nonzeros).
+    """
+    return constr.Sense, round(constr.RHS, 9), model.getRow(constr).size()
+
+
+def load_model_columns(lp_path):
+    """
+    Reads an LP file with gurobipy and returns {variable name: {index: (objective coefficient,
+    [(row signature, constraint coefficient)])}}, where index is the bracketed suffix of the column
+    name ('' for scalar variables).
+    """
+    # Imported here so that mapping runs without a Gurobi installation when no LP files exist
+    import gurobipy as gp
+
+    model = gp.read(lp_path)
+    rows = {constr.index: row_signature(model, constr) for constr in model.getConstrs()}
+    columns = {}
+    for var in model.getVars():
+        match = ELEMENT_NAME_PATTERN.match(var.VarName)
+        if not match:
+            continue
+        name, index = match.group(1), match.group(2) or ''
+        col = model.getCol(var)
+        coefficients = [(rows[col.getConstr(i).index], col.getCoeff(i)) for i in range(col.size())]
+        columns.setdefault(name, {})[index] = (var.Obj, coefficients)
+    model.dispose()
+    return columns
+
+
+def normalized_signature(objective_coefficient, coefficients):
+    """
+    Returns (scale, signature) for a column. The signature is the column (objective coefficient
+    followed by the sorted (row signature, constraint coefficient) pairs) divided by its
+    largest-magnitude entry, so two columns that are scalar multiples of each other share a signature
+    and the ratio of their scales is the scalar. Keeping the row of every coefficient tells apart
+    columns that only share the multiset of their coefficients. Empty columns return (None, None).
+    """
+    entries = [objective_coefficient] + [c for _, c in coefficients]
+    scale = max(entries, key=abs)
+    if scale == 0:
+        return None, None
+    # Sorting after normalisation keeps the signature independent of the sign of the scale
+    signature = (round(objective_coefficient / scale, 9),) + tuple(
+        sorted((row, round(c / scale, 9)) for row, c in coefficients)
+    )
+    return scale, signature
+
+
+def variable_signature(elements):
+    """
+    Signature of a (possibly indexed) variable: the index set with the normalised signature of every
+    element. Returns (scales, signature), or (None, None) if any element has an empty column.
+    """
+    scales = {}
+    signature = []
+    for index in sorted(elements):
+        scale, element_signature = normalized_signature(*elements[index])
+        if element_signature is None:
+            return None, None
+        scales[index] = scale
+        signature.append((index, element_signature))
+    return scales, tuple(signature)
+
+
+def format_constant(value):
+    rounded = round(value)
+    if abs(value - rounded) <= TOLERANCE * max(1.0, abs(value)):
+        return int(rounded)
+    return float(f"{value:.12g}")
+
+
+def match_columns(columns1, columns2, variables1=None, variables2=None):
+    """
+    Resolves Problem 1 variables whose columns are exact or scalar multiples of exactly one Problem 2
+    variable's columns. Returns mappings in the variable_mappings.json format:
+    {var1: [{"constant": c, "variable": var2}]}, meaning var1 = c * var2.
+    Ambiguous signatures (shared by several variables on either side) are left unresolved.
+    """
+    if variables1 is not None:
+        columns1 = {name: cols for name, cols in columns1.items() if name in variables1}
+    if variables2 is not None:
+        columns2 = {name: cols for name, cols in columns2.items() if name in variables2}
+
+    by_signature1 = {}
+    for name, elements in columns1.items():
+        scales, signature = variable_signature(elements)
+        if signature is not None:
+            by_signature1.setdefault(signature, []).append((name, scales))
+    by_signature2 = {}
+    for name, elements in columns2.items():
+        scales, signature = variable_signature(elements)
+        if signature is not None:
+            by_signature2.setdefault(signature, []).append((name, scales))
+
+    mappings = {}
+    for signature, candidates1 in by_signature1.items():
+        candidates2 = by_signature2.get(signature, [])
+        if len(candidates1) != 1 or len(candidates2) != 1:
+            continue
+        (name1, scales1), (name2, scales2) = candidates1[0], candidates2[0]
+
+        # column1 = s * column2 for every element, hence var1 = var2 / s
+        ratios = [scales1[index] / scales2[index] for index in scales1]
+        s = ratios[0]
+        if any(abs(r - s) > TOLERANCE * max(1.0, abs(s)) for r in ratios):
+            continue
+        mappings[name1] = [{"constant": format_constant(1.0 / s), "variable": name2}]
+    return mappings
+
+
+def structural_prematch(problem_dir, sub_dir, variables1, variables2):
+    """
+    Pre-pass for a problem pair: returns the mappings that can be read off the instantiated models
+    (model.lp in both directories) without an LLM call, or {} if either model is missing.
+    """
+    lp1 = os.path.join(problem_dir, MODEL_LP_FILE)
+    lp2 = os.path.join(sub_dir, MODEL_LP_FILE)
+    if not (os.path.isfile(lp1) and os.path.isfile(lp2)):
+        return {}
+    try:
+        columns1 = load_model_columns(lp1)
+        columns2 = load_model_columns(lp2)
+    except Exception as e:
+        print(f"Could not read the instantiated models for {problem_dir} and {sub_dir}: {e}")
+        return {}
+    return match_columns(columns1, columns2, variables1, variables2)
@@ -1,11 +1,31 @@
 import os
+import sys
 import json
 import re
 from openai import OpenAI
 
+# The shared LLM client helpers (response cache) live in Evaluation/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Evaluation'))
+from llm_batch import BatchRequests, run_batch
+from llm_client import chat_completion, print_cache_stats
+from llm_telemetry import llm_tags
+from model_tiers import DEFAULT_TIERS, TierStats
+
 # Set your OpenAI API key
 client = OpenAI(api_key='your-api-key')
 
+# Models tried in order, cheapest first. A judgment goes to the next tier only when the answer does
+# not end with a clear "Equivalent" / "Not Equivalent" line.
+MODEL_TIERS = DEFAULT_TIERS
+tier_stats = TierStats(MODEL_TIERS)
+
+# Nightly sweeps: send the first-tier judgments of every pair as one Batch API job, ingest the
+# results into the response cache, then judge as usual (only escalations are sent interactively)
+BATCH_MODE = False
+
+# Subdirectory suffix of the formulation compared with the original problem
+COMPARED_SUFFIX = "_l"
+
 # -----------------------------------
 # 1. Helper Functions
 # -----------------------------------
@@ -74,47 +94,131 @@ Briefly explain the reasoning in 1-2 sentences, then end with the word "Equivale
     print(prompt)
     return prompt
 
-def ask_gpt_equivalence(problem_info_1, problem_info_2, problem_type):
+def parse_equivalence_verdict(content):
     """
-    Calls the OpenAI GPT model to decide whether two problem formulations 
-    are equivalent. Returns (bool_equivalent, raw_gpt_response).
+    Reads the final line of a GPT answer. Returns True for "Equivalent", False for
+    "Not Equivalent", and None if the final line is neither.
+    """
+    lines = content.strip().splitlines()
+    if not lines:
+        return None
+    last_line = lines[-1].strip().lower()
+    if last_line == "equivalent":
+        return True
+    elif last_line == "not equivalent":
+        return False
+    return None
+
+def create_equivalence_messages(problem_info_1, problem_info_2, problem_type):
+    """
+    Chat messages of an equivalence judgment (shared by the interactive and batch modes).
     """
     prompt = create_equivalence_prompt(problem_info_1, problem_info_2, problem_type)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an expert in mathematical optimization problems. "
+                "You decide if two given formulations represent the same problem."
+            )
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an expert in mathematical optimization problems. "
-                        "You decide if two given formulations represent the same problem."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.0
-        )
-
-        content = response.choices[0].message.content.strip()
-        # Extract the final word in the response for definitive judgment
-        last_line = content.splitlines()[-1].strip().lower()
-        
-        if last_line == "equivalent":
-            return True, content
-        elif last_line == "not equivalent":
-            return False, content
-        else:
-            # If the final line isn't clear, treat as "Not Equivalent" by default
-            return False, content
+def ask_gpt_equivalence(problem_info_1, problem_info_2, problem_type):
+    """
+    Calls the OpenAI GPT models to decide whether two problem formulations 
+    are equivalent, starting with the cheapest tier and escalating only
+    when the answer is unclear. Returns (bool_equivalent, raw_gpt_response).
+    """
+    messages = create_equivalence_messages(problem_info_1, problem_info_2, problem_type)
+
+    content = ""
+    for tier, model in enumerate(MODEL_TIERS):
+        with tier_stats.timed(model, 1) as result, llm_tags(tier=tier):
+            try:
+                response = chat_completion(
+                    client,
+                    model=model,
+                    messages=messages,
+                    temperature=0.0
+                )
+            except Exception as e:
+                print(f"[ERROR] OpenAI request failed: {e}")
+                return False, str(e)
+
+            content = response.choices[0].message.content.strip()
+            # Extract the final word in the response for definitive judgment
+            verdict = parse_equivalence_verdict(content)
+            if verdict is not None:
+                result['accepted'] = 1
+                return verdict, content
+
+        if tier + 1 < len(MODEL_TIERS):
+            print(f"Unclear verdict from {model}, escalating to {MODEL_TIERS[tier + 1]}")
+
+    # If the final line isn't clear even for the last tier, treat as "Not Equivalent" by default
+    return False, content
+
+
+def load_pair(base_dir, problem_dir):
+    """
+    Loads the original formulation of a problem and the one in its COMPARED_SUFFIX
+    subdirectory. Returns (problem_type, original_data, new_data, subdir_name),
+    or None (with the reason printed) if the pair cannot be judged.
+    """
+    problem_path = os.path.join(base_dir, problem_dir)
+    
+    # Determine if LP or MIP
+    problem_type = is_problem_lp(problem_path)  # returns 'LP', 'MIP', or None
+    if problem_type not in ["LP", "MIP"]:
+        # Skip if it's not recognized or has no optimus-code.py
+        print(f"Skipping '{problem_dir}' because it's neither recognized as LP nor MIP.")
+        return None
+    
+    # Now handle LP or MIP in the same pipeline:
+    
+    # Original problem_info.json
+    original_info_path = os.path.join(problem_path, "problem_info.json")
+    if not os.path.isfile(original_info_path):
+        print(f"Skipping '{problem_dir}' - no problem_info.json found.")
+        return None
+    
+    # Subdirectory with the suffix (e.g., "243_l")
+    c_subdir_name = f"{problem_dir}{COMPARED_SUFFIX}"
+    c_subdir_path = os.path.join(problem_path, c_subdir_name)
+    new_info_path = os.path.join(c_subdir_path, "problem_info.json")
+    
+    if not os.path.isdir(c_subdir_path) or not os.path.isfile(new_info_path):
+        print(f"Skipping '{problem_dir}' - no '{c_subdir_name}' subdirectory or problem_info.json.")
+        return None
+    
+    # Load JSON data
+    original_data = load_problem_info(original_info_path)
+    new_data = load_problem_info(new_info_path)
+    
+    if not (original_data and new_data):
+        print(f"Skipping '{problem_dir}' - failed to load JSON data.")
+        return None
+    return problem_type, original_data, new_data, c_subdir_name
 
-    except Exception as e:
-        print(f"[ERROR] OpenAI request failed: {e}")
-        return False, str(e)
+def prefetch_with_batch(base_dir, candidates):
+    """
+    Sends the first-tier judgment of every pair as one Batch API job. The results
+    land in the response cache, where ask_gpt_equivalence picks them up.
+    """
+    requests = BatchRequests()
+    for problem_dir in candidates:
+        pair = load_pair(base_dir, problem_dir)
+        if pair is None:
+            continue
+        problem_type, original_data, new_data, _ = pair
+        messages = create_equivalence_messages(original_data, new_data, problem_type)
+        requests.add(MODEL_TIERS[0], messages, 0.0)
+    run_batch(client, requests, 'equivalence')
 
 
 # -----------------------------------
@@ -142,43 +246,18 @@ def main():
         if os.path.isdir(os.path.join(base_dir, d)) and d.isdigit()
     ]
     
+    if BATCH_MODE:
+        prefetch_with_batch(base_dir, candidates)
+
     for problem_dir in candidates:
-        problem_path = os.path.join(base_dir, problem_dir)
-        
-        # Determine if LP or MIP
-        problem_type = is_problem_lp(problem_path)  # returns 'LP', 'MIP', or None
-        if problem_type not in ["LP", "MIP"]:
-            # Skip if it's not recognized or has no optimus-code.py
-            print(f"Skipping '{problem_dir}' because it's neither recognized as LP nor MIP.")
-            continue
-        
-        # Now handle LP or MIP in the same pipeline:
-        
-        # Original problem_info.json
-        original_info_path = os.path.join(problem_path, "problem_info.json")
-        if not os.path.isfile(original_info_path):
-            print(f"Skipping '{problem_dir}' - no problem_info.json found.")
-            continue
-        
-        # Subdirectory with _g (e.g., "243_g")
-        c_subdir_name = f"{problem_dir}_l"
-        c_subdir_path = os.path.join(problem_path, c_subdir_name)
-        new_info_path = os.path.join(c_subdir_path, "problem_info.json")
-        
-        if not os.path.isdir(c_subdir_path) or not os.path.isfile(new_info_path):
-            print(f"Skipping '{problem_dir}' - no '{c_subdir_name}' subdirectory or problem_info.json.")
-            continue
-        
-        # Load JSON data
-        original_data = load_problem_info(original_info_path)
-        new_data = load_problem_info(new_info_path)
-        
-        if not (original_data and new_data):
-            print(f"Skipping '{problem_dir}' - failed to load JSON data.")
+        pair = load_pair(base_dir, problem_dir)
+        if pair is None:
             continue
+        problem_type, original_data, new_data, c_subdir_name = pair
         
         # Ask GPT if they are equivalent
-        is_equiv, gpt_response = ask_gpt_equivalence(original_data, new_data, problem_type)
+        with llm_tags(problem=problem_dir, suffix=c_subdir_name[len(problem_dir):]):
+            is_equiv, gpt_response = ask_gpt_equivalence(original_data, new_data, problem_type)
         
         if is_equiv:
             results[problem_type]["equivalent"].append(problem_dir)
@@ -205,5 +284,8 @@ def main():
         print("   ", neq_list)
         print(f"  Count: {len(neq_list)}\n")
 
+    print_cache_stats()
+    tier_stats.print_summary('judgments')
+
 if __name__ == "__main__":
     main()
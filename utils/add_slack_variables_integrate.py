@@ -5,6 +5,8 @@ import ast
 import astor
 import shutil
 
+from transform_mapping import identity_mapping, write_mapping
+
 def normalize_code(code_str):
     """
     Normalizes code strings by removing whitespace, converting to lowercase,
@@ -322,6 +324,9 @@ def process_files(input_json_path, input_code_path, output_json_path, output_cod
         print(f"Input file {input_code_path} not found.")
         return
 
+    # Every original variable is kept as is; the slack variables have no counterpart
+    mapping = identity_mapping(json_data['variables'])
+
     # Modify the JSON data and get the constraint_slack_map
     modified_json_data, constraint_slack_map = modify_problem_info(json_data)
 
@@ -341,6 +346,8 @@ def process_files(input_json_path, input_code_path, output_json_path, output_cod
         f.write(modified_code_data)
     print(f"Successfully wrote transformed code to {output_code_path}")
 
+    write_mapping(output_json_dir, mapping)
+
 def main():
     base_input_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy/'
     base_output_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy/'
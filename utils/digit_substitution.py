@@ -4,6 +4,8 @@ import os
 import re
 import shutil
 
+from transform_mapping import identity_mapping, mapping_term, write_mapping
+
 def load_json(filepath):
     with open(filepath, "r") as f:
         return json.load(f)
@@ -77,6 +79,12 @@ def perform_digit_decomposition(problem_info_file, solution_file, original_code_
                     "k": k
                 }
 
+    # Ground-truth mapping: x = sum_i x_i * 10^i for decomposed variables, identity for the others
+    mapping = identity_mapping(problem_info.get("variables", {}))
+    for var_name, info in variables_to_decompose.items():
+        mapping[var_name] = [mapping_term(10 ** i, f"{var_name}_{i}") for i in range(info["k"])]
+    write_mapping(os.path.dirname(digit_problem_info_file), mapping)
+
     if not variables_to_decompose:
         # No variables found that require digit decomposition
         # Just copy files
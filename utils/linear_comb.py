@@ -3,6 +3,8 @@ import re
 import os
 import glob
 
+from transform_mapping import mapping_term, write_mapping
+
 def replace_variables_formulation(text, var_replacements):
     """
     Replaces variables in LaTeX formulations.
@@ -51,12 +53,14 @@ def split_variables(json_data):
     """
     Splits each variable into two parts in the JSON data.
     Replaces occurrences of the original variables with the sum of the two new variables.
+    Returns the modified JSON data and the ground-truth mapping (x = x1 + x2).
     """
     variables = json_data['variables']
     original_variables = list(variables.keys())
 
     # Build mappings for variable replacements
     var_replacements = {}
+    mapping = {}
 
     for var_name in original_variables:
         var_info = variables[var_name]
@@ -68,6 +72,7 @@ def split_variables(json_data):
             new_var_info = var_info.copy()
             new_var_info['description'] = f"Part {suffix} of variable {var_name}: {var_info.get('description', '')}"
             variables[new_var_name] = new_var_info
+        mapping[var_name] = [mapping_term(1, var_name + '1'), mapping_term(1, var_name + '2')]
         # Prepare replacements for indexed and non-indexed variables
         if 'shape' in var_info and var_info['shape']:
             # Variable is indexed
@@ -100,7 +105,7 @@ def split_variables(json_data):
         for code_lang, code_str in objective['code'].items():
             objective['code'][code_lang] = replace_variables_code(code_str, var_replacements)
 
-    return json_data
+    return json_data, mapping
 
 def process_single_json(input_filepath, output_filepath):
     """
@@ -122,7 +127,7 @@ def process_single_json(input_filepath, output_filepath):
         return
 
     # Modify the JSON data
-    modified_json_data = split_variables(json_data)
+    modified_json_data, mapping = split_variables(json_data)
 
     # Write the modified JSON to the output file
     try:
@@ -131,6 +136,9 @@ def process_single_json(input_filepath, output_filepath):
         print(f"Successfully wrote modified JSON to {output_filepath}")
     except Exception as e:
         print(f"Failed to write modified JSON to {output_filepath}: {e}")
+        return
+
+    write_mapping(output_dir, mapping)
 
 def process_all_problem_info_files():
     """
@@ -3,6 +3,12 @@ from openai import OpenAI
 import time
 import os
 import re
+import sys
+
+# The shared LLM client helpers (response cache) live in Evaluation/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Evaluation'))
+from llm_client import chat_completion, print_cache_stats
+from llm_telemetry import llm_tags
 
 # Set your OpenAI API key
 client = OpenAI(api_key='your-api-key')
@@ -10,16 +16,22 @@ client = OpenAI(api_key='your-api-key')
 # Define the root directory where your directories are located
 root_directory = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy'
 
+# Suffixes of the variant directories whose descriptions are rephrased (e.g. 12_a)
+SUFFIXES = ['_a']
+
 def paraphrase(text):
     prompt = f"Paraphrase the following text while keeping its original meaning:\n\n\"{text}\"\n\nParaphrased:"
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o", 
-        messages=[
-            {"role": "system", "content": "You are an expert in paraphrasing."},
-            {"role": "user", "content": prompt}
-        ]
-    )
+        response = chat_completion(
+            client,
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are an expert in paraphrasing."},
+                {"role": "user", "content": prompt}
+            ],
+            # Re-running on unchanged descriptions reuses the paraphrases already paid for
+            cache_samples=True
+        )
         paraphrased_text = response.choices[0].message.content
         return clean_text(paraphrased_text)
     except Exception as e:
@@ -66,6 +78,16 @@ def update_descriptions(data):
         data['objective']['description'] = paraphrased_desc
     return data
 
+def problem_tags(dir_name):
+    """
+    Telemetry tags of a problem directory: '12_a' is problem '12' with suffix '_a'; a directory without
+    a known suffix (e.g. the root problem '12') is tagged with its name and no suffix.
+    """
+    suffix = next((s for s in SUFFIXES if dir_name.endswith(s)), None)
+    if suffix is None:
+        return {'problem': dir_name}
+    return {'problem': dir_name[:-len(suffix)], 'suffix': suffix}
+
 def save_updated_json(data, filepath):
     with open(filepath, 'w') as f:
         json.dump(data, f, indent=4)
@@ -73,7 +95,7 @@ def save_updated_json(data, filepath):
 # Traverse the directory structure
 for subdir, _, files in os.walk(root_directory):
     # Process only directories that end with '_0' and contain problem_info.json
-    if subdir.endswith('_a') and 'problem_info.json' in files:
+    if subdir.endswith(tuple(SUFFIXES)) and 'problem_info.json' in files:
         problem_info_path = os.path.join(subdir, 'problem_info.json')
         print(f'Processing: {problem_info_path}')
         
@@ -82,9 +104,13 @@ for subdir, _, files in os.walk(root_directory):
             data = json.load(f)
         
         # Update the descriptions
-        updated_data = update_descriptions(data)
+        problem_dir_name = os.path.basename(subdir)
+        with llm_tags(**problem_tags(problem_dir_name)):
+            updated_data = update_descriptions(data)
         
         # Save the updated JSON data
         save_updated_json(updated_data, problem_info_path)
         
-        print(f'Updated descriptions in: {problem_info_path}\n')
\ No newline at end of file
+        print(f'Updated descriptions in: {problem_info_path}\n')
+
+print_cache_stats()
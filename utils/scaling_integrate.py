@@ -2,6 +2,8 @@ import json
 import re
 import os
 
+from transform_mapping import identity_mapping, mapping_term, write_mapping
+
 def replace_variables_formulation(text, var_replacements):
     """
     Replaces variables in LaTeX formulations.
@@ -141,7 +143,8 @@ def process_json_file(json_filepath, output_filepath, common_continuous):
 
 def process_gurobi_file(gurobi_filepath, output_filepath, common_continuous):
     """
-    Process the Gurobi file with filtered continuous variables
+    Process the Gurobi file with filtered continuous variables.
+    Returns the scaling factor of every scaled variable ({} on error).
     """
     try:
         with open(gurobi_filepath, 'r') as f:
@@ -188,9 +191,23 @@ def process_gurobi_file(gurobi_filepath, output_filepath, common_continuous):
         with open(output_filepath, 'w') as f:
             f.writelines(final_lines)
         print(f"Successfully processed Gurobi file: {output_filepath}")
+        return var_scaling
         
     except Exception as e:
         print(f"Error processing Gurobi file {gurobi_filepath}: {e}")
+        return {}
+
+def build_scaling_mapping(json_filepath, var_scaling):
+    """
+    Ground-truth mapping of a scaled variant: x = (1/factor) * x for every scaled variable,
+    identity for the others. The factors are the ones of the code file, which produces solution.json.
+    """
+    with open(json_filepath, 'r') as f:
+        variables = json.load(f).get('variables', {})
+    mapping = identity_mapping(variables)
+    for var_name, scaling_factor in var_scaling.items():
+        mapping[var_name] = [mapping_term(1 / scaling_factor, var_name)]
+    return mapping
 
 def process_directory(base_dir):
     """
@@ -215,7 +232,8 @@ def process_directory(base_dir):
             
             # Process both files
             process_json_file(json_filepath, json_output, common_continuous)
-            process_gurobi_file(gurobi_filepath, gurobi_output, common_continuous)
+            var_scaling = process_gurobi_file(gurobi_filepath, gurobi_output, common_continuous)
+            write_mapping(output_dir, build_scaling_mapping(json_filepath, var_scaling))
 
 if __name__ == "__main__":
     base_dir = '/Users/stevenzhai/Desktop/MILP_data/sample-data-easy'
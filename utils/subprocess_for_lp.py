@@ -1,21 +1,37 @@
 import glob
-import subprocess
 import os
+import sys
+
+# The script worker pool and its run log live in Evaluation/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Evaluation'))
+from run_log import RUN_LOG_PATH
+from script_pool import ScriptPool
 
 base_dir = "/Users/stevenzhai/Desktop/MILP_data/sample-data-easy"
 
-# This pattern will find all optimus-code.py under directories ending with _c:
-# e.g., /Users/stevenzhai/Desktop/MILP_data/sample-data-easy/*/*_c/optimus-code.py
-pattern = os.path.join(base_dir, "*", "*_c", "optimus-code.py")
-
-files_to_run = glob.glob(pattern)
-
-for fpath in files_to_run:
-    print(f"Running: {fpath}")
-    result = subprocess.run(["python", fpath], capture_output=True, text=True)
-    
-    # Print stdout and stderr for debugging
-    print("Output:", result.stdout)
-    print("Errors:", result.stderr)
-    print("Return code:", result.returncode)
-    print("=======================================")
+# Worker processes executing the scripts; each one imports gurobipy once and keeps it loaded
+WORKERS = 1
+# Seconds a script may run before its worker is stopped
+SCRIPT_TIMEOUT = 600
+
+
+def main():
+    # This pattern will find all optimus-code.py under directories ending with _c:
+    # e.g., /Users/stevenzhai/Desktop/MILP_data/sample-data-easy/*/*_c/optimus-code.py
+    pattern = os.path.join(base_dir, "*", "*_c", "optimus-code.py")
+
+    files_to_run = glob.glob(pattern)
+
+    with ScriptPool(WORKERS, SCRIPT_TIMEOUT, run_log=RUN_LOG_PATH) as pool:
+        for result in pool.map(files_to_run):
+            print(f"Running: {result.path}")
+
+            # Print stdout and stderr for debugging
+            print("Output:", result.stdout)
+            print("Errors:", result.stderr)
+            print("Return code:", result.returncode)
+            print("=======================================")
+
+
+if __name__ == "__main__":
+    main()
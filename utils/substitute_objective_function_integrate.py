@@ -3,6 +3,8 @@ import re
 import json
 import shutil
 
+from transform_mapping import identity_mapping, write_mapping
+
 def extract_objective_components(objective_code):
     """
     Extracts the objective expression and optimization direction from the gurobipy code.
@@ -214,6 +216,9 @@ def process_json_file(input_json_path, output_json_path):
         print(f"Input file {input_json_path} does not exist.")
         return
     
+    # Every original variable is kept as is; zed has no counterpart
+    mapping = identity_mapping(json_data.get('variables', {}))
+
     # Modify the JSON data
     modified_json_data = modify_json_data(json_data)
     
@@ -224,6 +229,9 @@ def process_json_file(input_json_path, output_json_path):
         print(f"Successfully wrote modified JSON to {output_json_path}")
     except Exception as e:
         print(f"Failed to write modified JSON to {output_json_path}: {e}")
+        return
+
+    write_mapping(output_dir, mapping)
 
 def process_code_file(input_code_path, output_code_path):
     """
@@ -0,0 +1,29 @@
+import json
+import os
+
+# Ground-truth variable mapping written by the generators next to every variant they create, in the
+# schema of variable_mappings.json (read by Evaluation/step2_map.py):
+# {source variable: [{"constant": c, "variable": variant variable}, ...]}
+MAPPING_FILE = 'mapping.json'
+
+
+def mapping_term(constant, variable):
+    return {"constant": constant, "variable": variable}
+
+
+def identity_mapping(variable_names):
+    """
+    Maps every source variable to the variant variable of the same name.
+    """
+    return {name: [mapping_term(1, name)] for name in variable_names}
+
+
+def write_mapping(output_dir, mapping):
+    """
+    Writes the mapping to mapping.json in the output directory of a generated variant.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, MAPPING_FILE)
+    with open(path, 'w') as f:
+        json.dump(mapping, f, indent=4)
+    print(f"Wrote transform mapping to {path}")
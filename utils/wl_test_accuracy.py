@@ -1,6 +1,13 @@
 import glob
 import os
-import subprocess
+import sys
+
+# The script worker pool lives in Evaluation/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Evaluation'))
+from script_pool import ScriptPool
+
+# Seconds a wltest.py may run before its worker is stopped
+SCRIPT_TIMEOUT = 600
 
 def get_problem_type(optimus_path):
     """
@@ -14,19 +21,18 @@ def get_problem_type(optimus_path):
                 return line.split(":", 1)[1].strip()
     return None
 
-def get_wl_hash(wltest_path):
+def get_wl_hash(pool, wltest_path):
     """
-    Runs `python wltest.py` at the given path and returns the hash printed
+    Runs wltest.py at the given path in the worker pool and returns the hash printed
     (the part after 'WL Hash:').
     """
-    try:
-        result = subprocess.check_output(["python", wltest_path], text=True)
-    except Exception as e:
-        print(f"Could not run wltest.py at {wltest_path}: {e}")
+    result = pool.run(wltest_path)
+    if not result.ok:
+        print(f"Could not run wltest.py at {wltest_path}: {result.stderr.strip()}")
         return None
     
     # Look for a line like: "WL Hash: abc123xyz"
-    for line in result.splitlines():
+    for line in result.stdout.splitlines():
         if line.startswith("WL Hash:"):
             return line.split(":", 1)[1].strip()
     return None
@@ -57,60 +63,62 @@ def main():
 
     # Find all matching optimus_code.py files in _c folders
     c_optimus_paths = glob.glob(pattern)
-    for c_optimus_path in c_optimus_paths:
-        # Example c_optimus_path:
-        #   /Users/.../266/266_c/optimus_code.py
-        
-        # _c directory
-        c_dir = os.path.dirname(c_optimus_path)  
-        # base problem directory
-        problem_dir = os.path.dirname(c_dir)     
-        # c_dirname is something like "266_c"
-        c_dirname = os.path.basename(c_dir)      
-        
-        # Extract the "problem_id" from "266_c" by stripping the trailing "_c"
-        if c_dirname.endswith("_c"):
-            problem_id = c_dirname[:-2]  # remove "_c"
-        else:
-            # fallback if something doesn't match the pattern
-            continue
-        
-        # Read the problem type from the c_optimus_path
-        problem_type = get_problem_type(c_optimus_path)
-
-        # Now find the matching i_dir, e.g. "266_i"
-        i_dirname = f"{problem_id}_i"
-        i_dir = os.path.join(problem_dir, i_dirname)
-
-        # We'll look for wltest.py in both c_dir and i_dir
-        wltest_c = os.path.join(c_dir, 'wltest.py')
-        wltest_i = os.path.join(i_dir, 'wltest.py')
-
-        # Get the WL hashes if files exist
-        c_hash = get_wl_hash(wltest_c) if os.path.isfile(wltest_c) else None
-        i_hash = get_wl_hash(wltest_i) if os.path.isfile(wltest_i) else None
-
-        # Store in our dictionary
-        problem_data[problem_id] = {
-            'type': problem_type,
-            'c_hash': c_hash,
-            'i_hash': i_hash
-        }
-
-        # Update global frequency counts
-        for hsh in (c_hash, i_hash):
-            if hsh is not None:
-                hash_frequency[hsh] = hash_frequency.get(hsh, 0) + 1
-
-        # If we know it's LP or MIP, increment counters
-        if problem_type == "LP":
-            lp_count += 1
-            if c_hash and i_hash and c_hash == i_hash:
-                lp_matches += 1
-        elif problem_type == "MIP":
-            mip_count += 1
-            if c_hash and i_hash and c_hash == i_hash:
-                mip_matches += 1
+    # One persistent worker runs every wltest.py, so gurobipy is imported once
+    with ScriptPool(1, SCRIPT_TIMEOUT) as pool:
+        for c_optimus_path in c_optimus_paths:
+            # Example c_optimus_path:
+            #   /Users/.../266/266_c/optimus_code.py
+
+            # _c directory
+            c_dir = os.path.dirname(c_optimus_path)  
+            # base problem directory
+            problem_dir = os.path.dirname(c_dir)     
+            # c_dirname is something like "266_c"
+            c_dirname = os.path.basename(c_dir)      
+
+            # Extract the "problem_id" from "266_c" by stripping the trailing "_c"
+            if c_dirname.endswith("_c"):
+                problem_id = c_dirname[:-2]  # remove "_c"
+            else:
+                # fallback if something doesn't match the pattern
+                continue
+
+            # Read the problem type from the c_optimus_path
+            problem_type = get_problem_type(c_optimus_path)
+
+            # Now find the matching i_dir, e.g. "266_i"
+            i_dirname = f"{problem_id}_i"
+            i_dir = os.path.join(problem_dir, i_dirname)
+
+            # We'll look for wltest.py in both c_dir and i_dir
+            wltest_c = os.path.join(c_dir, 'wltest.py')
+            wltest_i = os.path.join(i_dir, 'wltest.py')
+
+            # Get the WL hashes if files exist
+            c_hash = get_wl_hash(pool, wltest_c) if os.path.isfile(wltest_c) else None
+            i_hash = get_wl_hash(pool, wltest_i) if os.path.isfile(wltest_i) else None
+
+            # Store in our dictionary
+            problem_data[problem_id] = {
+                'type': problem_type,
+                'c_hash': c_hash,
+                'i_hash': i_hash
+            }
+
+            # Update global frequency counts
+            for hsh in (c_hash, i_hash):
+                if hsh is not None:
+                    hash_frequency[hsh] = hash_frequency.get(hsh, 0) + 1
+
+            # If we know it's LP or MIP, increment counters
+            if problem_type == "LP":
+                lp_count += 1
+                if c_hash and i_hash and c_hash == i_hash:
+                    lp_matches += 1
+            elif problem_type == "MIP":
+                mip_count += 1
+                if c_hash and i_hash and c_hash == i_hash:
+                    mip_matches += 1
 
     # Print a summary
     print("=== Summary of WL Hashes by Problem ===")